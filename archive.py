@@ -0,0 +1,132 @@
+"""
+Archival
+Moves past and cancelled appointments out of the hot table in small batches
+Run: python archive.py [--database bookings.db] [--keep-days 7]   (or let bot.py run it periodically)
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from database import ARCHIVE_BATCH_SIZE, AsyncDatabase, Database
+
+logger = logging.getLogger(__name__)
+
+VACUUM_PAGES = 2000  # free pages released per run (4 KiB each by default)
+
+
+class Archiver:
+    """Keeps the appointments table down to recent and upcoming bookings
+
+    Each run moves appointments dated more than `keep_days` days ago, and
+    cancelled ones, to appointments_archive. It works in transactions of
+    `batch_size` rows and pauses between them so handler queries are not
+    held up. Afterwards it releases freed pages (incremental vacuum) and
+    refreshes planner statistics. Archived rows stay readable through
+    Database.get_user_history / get_history_by_date.
+    """
+
+    def __init__(self, db: AsyncDatabase, keep_days: int = 7, interval: float = 6 * 3600,
+                 batch_size: int = ARCHIVE_BATCH_SIZE, pause: float = 0.05,
+                 vacuum_pages: int = VACUUM_PAGES, first_run_delay: float = 60.0):
+        self.db = db
+        self.keep_days = keep_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.vacuum_pages = vacuum_pages
+        self.first_run_delay = first_run_delay
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.runs = 0
+        self.archived = 0
+        self.pages_released = 0
+        self.last_run_seconds = 0.0
+
+    def start(self):
+        """Spawn the periodic archival task"""
+        self._task = asyncio.create_task(self._run(), name="archiver")
+
+    async def _run(self):
+        # Not at startup: a cold start should answer its first update first
+        await asyncio.sleep(self.first_run_delay)
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Archival failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> int:
+        """Archive everything due, then compact; returns the number of rows moved"""
+        start = time.monotonic()
+        before = (datetime.now().date() - timedelta(days=self.keep_days)).strftime('%Y-%m-%d')
+        moved = 0
+        while True:
+            count = await self.db.archive_appointments(before, self.batch_size)
+            moved += count
+            if count < self.batch_size:
+                break
+            await asyncio.sleep(self.pause)
+
+        # Also on runs that moved nothing: earlier runs may have left pages to release
+        compacted = await self.db.compact(self.vacuum_pages)
+        self.pages_released += compacted['pages_released']
+        if moved:
+            logger.info(f"Archived {moved} appointment(s) before {before}, "
+                        f"released {compacted['pages_released']} page(s)")
+        self.runs += 1
+        self.archived += moved
+        self.last_run_seconds = time.monotonic() - start
+        return moved
+
+    async def stop(self):
+        """Stop the periodic task (a batch in progress finishes first)"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def stats(self) -> Dict[str, float]:
+        """Run and row counters"""
+        return {
+            'runs': self.runs,
+            'archived': self.archived,
+            'pages_released': self.pages_released,
+            'last_run_ms': round(self.last_run_seconds * 1000, 1),
+        }
+
+
+async def _archive_now(args):
+    db = AsyncDatabase(Database(args.database))
+    try:
+        archiver = Archiver(db, keep_days=args.keep_days, batch_size=args.batch_size, pause=0,
+                            vacuum_pages=args.vacuum_pages)
+        before = await db.count_archive()
+        moved = await archiver.run_once()
+        after = await db.count_archive()
+    finally:
+        db.close()
+    print(f"Archived {moved} appointment(s): {before['hot']} -> {after['hot']} hot rows, "
+          f"{after['archived']} archived")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default='bookings.db')
+    parser.add_argument('--keep-days', type=int, default=7, help="past days kept in the hot table")
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument('--vacuum-pages', type=int, default=VACUUM_PAGES)
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    asyncio.run(_archive_now(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Availability Engine
+Computes every free start time of a day across staff, with bitwise operations on its bookings
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence
+
+DEFAULT_DURATION = 30  # minutes, for bookings made before durations were stored
+SLOT_INTERVAL = 30     # minutes between offered start times
+
+
+def to_minutes(time_str: str) -> int:
+    """Convert 'HH:MM' to minutes since midnight"""
+    return int(time_str[:2]) * 60 + int(time_str[3:5])
+
+
+def to_time_str(minutes: int) -> str:
+    """Convert minutes since midnight to 'HH:MM'"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def bookings_by_staff(rows: Iterable[tuple]) -> Dict[Optional[str], List[tuple]]:
+    """Group (staff_id, start, end) rows by staff member, in one pass"""
+    booked = {}
+    for row in rows:
+        staff_rows = booked.get(row[0])
+        if staff_rows is None:
+            booked[row[0]] = [row]
+        else:
+            staff_rows.append(row)
+    return booked
+
+
+def bookings_by_date(rows: Iterable[tuple]) -> Dict[str, Dict[Optional[str], List[tuple]]]:
+    """Group (date, staff_id, start, end) rows by date, then staff member, in one pass"""
+    days = {}
+    for row in rows:
+        booked = days.get(row[0])
+        if booked is None:
+            booked = days[row[0]] = {}
+        staff_rows = booked.get(row[1])
+        if staff_rows is None:
+            booked[row[1]] = [row]
+        else:
+            staff_rows.append(row)
+    return days
+
+
+def start_conflicts(rows: Iterable[tuple], duration: int) -> int:
+    """Bit m is set when `duration` minutes from m would overlap a booking
+    
+    Rows end in (start, end). A booking [start, end) rules out every start
+    in (start - duration, end), so each row is one shifted run of bits.
+    """
+    before = duration - 1
+    busy = 0
+    for row in rows:
+        first = row[-2] - before
+        if first < 0:
+            first = 0
+        busy |= ((1 << (row[-1] - first)) - 1) << first
+    return busy
+
+
+@lru_cache(maxsize=64)
+def start_mask(open_minute: int, close_minute: int, step: int = SLOT_INTERVAL) -> int:
+    """Bit m is set for every offered start minute in [open, close)"""
+    mask = 0
+    for minute in range(open_minute, close_minute, step):
+        mask |= 1 << minute
+    return mask
+
+
+try:
+    popcount = int.bit_count  # Python 3.10+
+except AttributeError:
+    def popcount(mask: int) -> int:
+        """Number of set bits of a mask"""
+        return bin(mask).count('1')
+
+
+def mask_minutes(mask: int) -> List[int]:
+    """The set bits of a mask, lowest first"""
+    minutes = []
+    while mask:
+        lowest = mask & -mask
+        minutes.append(lowest.bit_length() - 1)
+        mask ^= lowest
+    return minutes
+
+
+MAX_DURATION = 24 * 60  # longest service, in minutes
+
+
+class StaffRoster:
+    """Who works when and performs which service; free times across staff, and whom to book
+    
+    `staff` maps a staff ID to {'name', optional 'services' (default: all)
+    and optional 'hours' {'start', 'end'} (default: the business hours)}.
+    Bookings come grouped by bookings_by_staff. Each staff member's free
+    start times are one bitmask operation on their start_conflicts, and
+    the scan over staff stops as soon as every start time the service can
+    be offered at is free with someone, so on a quiet day most staff (and
+    their bookings) are never looked at. Bookings made before staff were
+    recorded (staff_id None) block every staff member.
+    """
+    
+    def __init__(self, staff: Dict[str, dict], services: Iterable[str], open_minute: int,
+                 close_minute: int, step: int = SLOT_INTERVAL):
+        services = list(services)
+        self.names = {staff_id: info['name'] for staff_id, info in staff.items()}
+        self.eligible = {
+            service: tuple(staff_id for staff_id, info in staff.items() if service in info.get('services', services))
+            for service in services
+        }
+        self._starts = {}
+        for staff_id, info in staff.items():
+            hours = info.get('hours')
+            span = (hours['start'] * 60, hours['end'] * 60) if hours else (open_minute, close_minute)
+            self._starts[staff_id] = start_mask(*span, step)
+        # Every start time a service can be offered at, by anyone
+        self._offered = {}
+        for service, eligible in self.eligible.items():
+            offered = 0
+            for staff_id in eligible:
+                offered |= self._starts[staff_id]
+            self._offered[service] = offered
+    
+    def free_start_mask(self, booked: Dict[Optional[str], List[tuple]], service: str, duration: int) -> int:
+        """Start minutes at which some eligible staff member is free for `duration` minutes, as a mask"""
+        offered = self._offered.get(service, 0)
+        legacy = start_conflicts(booked.get(None, ()), duration)
+        free = 0
+        for staff_id in self.eligible.get(service, ()):
+            rows = booked.get(staff_id)
+            conflicts = start_conflicts(rows, duration) | legacy if rows else legacy
+            free |= self._starts[staff_id] & ~conflicts
+            if free == offered:
+                break
+        return free
+    
+    def free_starts(self, booked: Dict[Optional[str], List[tuple]], service: str, duration: int) -> List[int]:
+        """Start minutes at which some eligible staff member is free for `duration` minutes"""
+        return mask_minutes(self.free_start_mask(booked, service, duration))
+    
+    def candidates(self, booked: Dict[Optional[str], List[tuple]], service: str, duration: int,
+                   start: int) -> Sequence[str]:
+        """Eligible staff free at `start`, least booked that day first"""
+        if start_conflicts(booked.get(None, ()), duration) >> start & 1:
+            return []
+        available = [
+            staff_id for staff_id in self.eligible.get(service, ())
+            if self._starts[staff_id] >> start & 1
+            and not start_conflicts(booked.get(staff_id, ()), duration) >> start & 1
+        ]
+        return sorted(available, key=lambda staff_id: sum(row[-1] - row[-2] for row in booked.get(staff_id, ())))
+
+
+class AvailabilityCache:
+    """LRU + TTL cache of free start masks keyed by (date, service)
+
+    Database writes call invalidate(date). Each date carries a version that
+    invalidate() bumps, so a result computed from rows read before a write
+    is never stored after it.
+    """
+    
+    def __init__(self, maxsize: int = 256, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (date, service) -> (expires_at, free start mask)
+        self._versions = {}            # date -> invalidation count
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+    
+    def version(self, date: str) -> int:
+        """Current version of a date, to pass back to put()"""
+        with self._lock:
+            return self._versions.get(date, 0)
+    
+    def get(self, date: str, service: str) -> Optional[int]:
+        """Cached free start mask, or None on a miss"""
+        key = (date, service)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def get_many(self, dates: Iterable[str], service: str) -> Dict[str, Optional[int]]:
+        """get() for several dates under one lock"""
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for date in dates:
+                key = (date, service)
+                entry = self._entries.get(key)
+                if entry is None or entry[0] < now:
+                    if entry is not None:
+                        del self._entries[key]
+                    self.misses += 1
+                    found[date] = None
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    found[date] = entry[1]
+        return found
+    
+    def put(self, date: str, service: str, free: int, version: int):
+        """Store a result unless the date changed since version() was read"""
+        with self._lock:
+            if self._versions.get(date, 0) != version:
+                return
+            self._entries[(date, service)] = (time.monotonic() + self.ttl, free)
+            self._entries.move_to_end((date, service))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, date: str):
+        """Drop every cached service for a date"""
+        with self._lock:
+            self._versions[date] = self._versions.get(date, 0) + 1
+            for key in [key for key in self._entries if key[0] == date]:
+                del self._entries[key]
+            self.invalidations += 1
+    
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'size': len(self._entries),
+            }
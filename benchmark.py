@@ -0,0 +1,1572 @@
+"""
+Benchmarks for the Scheduler Bot
+Run: python benchmark.py <name> [options]   (python benchmark.py -h for the list)
+All benchmarks use a temporary database, bookings.db is never touched.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+
+from availability import StaffRoster, bookings_by_staff, to_minutes, to_time_str
+from database import Database, AsyncDatabase
+from webhook_queue import UpdateQueue
+
+SERVICE_KEYS = ['haircut', 'beard', 'color', 'style']
+DURATIONS = {'haircut': 30, 'beard': 20, 'color': 90, 'style': 45}
+
+
+# ==================== Helpers ====================
+
+def temp_db_path(directory: str) -> str:
+    """Path for a throwaway database file"""
+    return os.path.join(directory, 'bench.db')
+
+
+def seed_appointments(db: Database, count: int, days: int = 7):
+    """Insert `count` confirmed appointments spread over the next `days` days"""
+    today = datetime.now()
+    for i in range(count):
+        date = (today + timedelta(days=i % days)).strftime('%Y-%m-%d')
+        minutes = 9 * 60 + (i * 30) % (9 * 60)
+        service = SERVICE_KEYS[i % len(SERVICE_KEYS)]
+        db.create_appointment(
+            1000 + i % 50, service, date,
+            f"{minutes // 60:02d}:{minutes % 60:02d}", f"User {i}", "+1234567890", DURATIONS[service]
+        )
+
+
+def import_bot(db_path: str, **env):
+    """bot.py on a throwaway database (it reads its settings from the environment when imported)"""
+    os.environ.update({
+        'BOT_TOKEN': '123456:bench',
+        'ADMIN_TELEGRAM_ID': str(BENCH_ADMIN_ID),
+        'WEBHOOK_URL': 'http://127.0.0.1',
+        'DATABASE_PATH': db_path,
+        **env,
+    })
+    logging.disable(logging.WARNING)  # bot.py logs every request at INFO
+    import bot
+    return bot
+
+
+def percentile(samples: list, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def report(label: str, operations: int, elapsed: float):
+    """Print one result line"""
+    print(f"{label:<40} {operations / elapsed:>12,.0f} ops/s  ({elapsed * 1000:.1f} ms total)")
+
+
+# ==================== Connection Benchmark ====================
+
+def _unpooled_query(db_name: str, sql: str, params: tuple):
+    """The original access pattern: connect, query, close"""
+    conn = sqlite3.connect(db_name)
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute(sql, params).fetchall()
+    conn.close()
+    return rows
+
+
+def _unpooled_insert(db_name: str, params: tuple):
+    conn = sqlite3.connect(db_name)
+    conn.execute('''
+        INSERT INTO appointments (telegram_id, name, phone, service, date, time, status)
+        VALUES (?, ?, ?, ?, ?, ?, 'confirmed')
+    ''', params)
+    conn.commit()
+    conn.close()
+
+
+def bench_connections(args):
+    """Queries per second: connection-per-query vs pooled WAL connections"""
+    today = datetime.now().strftime('%Y-%m-%d')
+    write_date = '2099-01-01'  # keeps inserted rows out of the read set
+    read_sql = '''
+        SELECT staff_id, start_min, end_min FROM appointments
+        WHERE status = 'confirmed' AND date = ?
+    '''
+    insert_params = (42, 'Bench', '+1', 'haircut', write_date, '10:00')
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_name = temp_db_path(directory)
+        db = Database(db_name)
+        seed_appointments(db, args.rows)
+        db.close()
+
+        # Baseline runs against a rollback-journal database, as before
+        conn = sqlite3.connect(db_name)
+        conn.execute('PRAGMA journal_mode=DELETE')
+        conn.close()
+
+        start = time.perf_counter()
+        for _ in range(args.queries):
+            _unpooled_query(db_name, read_sql, (today,))
+        report("reads, connection per query", args.queries, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(args.writes):
+            _unpooled_insert(db_name, insert_params)
+        report("writes, connection per query", args.writes, time.perf_counter() - start)
+
+        db = Database(db_name)
+        start = time.perf_counter()
+        for _ in range(args.queries):
+            db.get_booked_intervals(today)
+        report("reads, pooled WAL", args.queries, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(args.writes):
+            db.create_appointment(42, 'haircut', write_date, '10:00', 'Bench', '+1', 30)
+        report("writes, pooled WAL", args.writes, time.perf_counter() - start)
+        db.close()
+
+
+# ==================== Event Loop Latency ====================
+
+async def _probe_latencies(duration: float, interval: float) -> list:
+    """Simulated webhook requests: how late does each one get served?"""
+    latencies = []
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration
+    while loop.time() < deadline:
+        scheduled = loop.time()
+        await asyncio.sleep(interval)
+        latencies.append((loop.time() - scheduled - interval) * 1000)
+    return latencies
+
+
+async def _latency_run(db: AsyncDatabase, mode: str, args) -> list:
+    """Probe latency while a writer hammers create_appointment"""
+    stop = asyncio.Event()
+
+    async def writer():
+        i = 0
+        while not stop.is_set():
+            params = (i, 'haircut', '2099-01-01', '10:00', 'Bench', '+1', 30)
+            if mode == 'sync':
+                db.database.create_appointment(*params)  # blocks the loop, as the handlers used to
+            else:
+                await db.create_appointment(*params)
+            await asyncio.sleep(0)
+            i += 1
+
+    writers = [asyncio.create_task(writer()) for _ in range(args.writers if mode != 'idle' else 0)]
+    latencies = await _probe_latencies(args.seconds, args.interval / 1000)
+    stop.set()
+    await asyncio.gather(*writers)
+    return latencies
+
+
+def bench_event_loop(args):
+    """Webhook latency (p50/p99) while writes are in flight: sync vs async data layer"""
+    with tempfile.TemporaryDirectory() as directory:
+        database = Database(temp_db_path(directory))
+        if args.write_stall_ms:
+            # Emulate a slow disk: every write stalls like a slow fsync
+            original = database.create_appointment
+
+            def stalled_create(*params):
+                time.sleep(args.write_stall_ms / 1000)
+                return original(*params)
+            database.create_appointment = stalled_create
+
+        db = AsyncDatabase(database)
+        for mode in ('idle', 'sync', 'async'):
+            latencies = asyncio.run(_latency_run(db, mode, args))
+            print(f"{mode:<6} writes: p50 {percentile(latencies, 50):7.2f} ms   "
+                  f"p99 {percentile(latencies, 99):7.2f} ms   ({len(latencies)} probes)")
+        db.close()
+
+
+# ==================== Availability Engine ====================
+
+
+def _synthetic_day(bookings: int) -> list:
+    """(time, duration) rows for one day, spread over business hours"""
+    rows = []
+    for i in range(bookings):
+        minutes = 9 * 60 + i * 9 * 60 // bookings
+        rows.append((f"{minutes // 60:02d}:{minutes % 60:02d}", DURATIONS[SERVICE_KEYS[i % len(SERVICE_KEYS)]]))
+    return rows
+
+
+def _slot_available(date: str, time_str: str, duration: int, booked_slots: list) -> bool:
+    """The original is_slot_available: parse and compare every booking of the day"""
+    slot_time = datetime.strptime(f"{date} {time_str}", '%Y-%m-%d %H:%M')
+    slot_end = slot_time + timedelta(minutes=duration)
+    for booked_time_str, booked_duration in booked_slots:
+        booked_time = datetime.strptime(f"{date} {booked_time_str}", '%Y-%m-%d %H:%M')
+        if slot_time < booked_time + timedelta(minutes=booked_duration) and slot_end > booked_time:
+            return False
+    return True
+
+
+def _per_slot_scan(date: str, duration: int, booked_slots: list) -> list:
+    """The original date_selected loop: _slot_available for every slot"""
+    slots = []
+    for hour in range(9, 18):
+        for minute in [0, 30]:
+            time_str = f"{hour:02d}:{minute:02d}"
+            if _slot_available(date, time_str, duration, booked_slots):
+                slots.append(time_str)
+    return slots
+
+
+def bench_availability(args):
+    """Free-slot computation per date: per-slot scan vs the staff roster with one chair"""
+    date = '2099-01-01'
+    roster = StaffRoster({'chair': {'name': 'Chair'}}, SERVICE_KEYS, 9 * 60, 18 * 60)
+    for bookings in args.bookings:
+        booked_slots = _synthetic_day(bookings)
+        # What get_booked_intervals returns for the same day
+        rows = [('chair', to_minutes(time_str), to_minutes(time_str) + duration) for time_str, duration in booked_slots]
+        assert _per_slot_scan(date, 30, booked_slots) == \
+            [to_time_str(minute) for minute in roster.free_starts(bookings_by_staff(rows), 'haircut', 30)]
+
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            _per_slot_scan(date, 30, booked_slots)
+        report(f"per-slot scan, {bookings} bookings/day", args.iterations, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            roster.free_starts(bookings_by_staff(rows), 'haircut', 30)
+        report(f"bitmap, {bookings} bookings/day", args.iterations, time.perf_counter() - start)
+
+
+def bench_week_availability(args):
+    """Service -> date: the annotated week picker then the time picker vs the single-day path, by cache state"""
+    with tempfile.TemporaryDirectory() as directory:
+        bot = import_bot(temp_db_path(directory))
+        seed_appointments(bot.db.database, args.rows, days=args.days)
+        bot.db.database.get_connection().execute('ANALYZE')
+        print(f"{args.rows} bookings over {args.days} days, {args.rows * 7 // args.days} in the week")
+        slower = asyncio.run(_week_availability(bot, args))
+        bot.db.close()
+    if slower:
+        print(f"week picker + time picker more than {args.tolerance:.0%} slower than the single-day path: "
+              f"{', '.join(slower)}")
+        sys.exit(1)
+
+
+async def _week_availability(bot, args) -> list:
+    """Time both flows through bot.py's own pickers; the cache states where the week picker loses"""
+    today = datetime.now().date()
+    days = [day for day, _ in bot.views.week(today)]
+    chosen = days[1]
+
+    def forget(which: list):
+        for day in which:
+            bot.slot_cache.invalidate(day)  # what a booking on that day does
+
+    # The counts on the week picker match what each day's time picker offers
+    forget(days)
+    assert all(count is None for count in bot.week_availability(today, 'haircut').values())
+    await bot.warm_availability(days, 'haircut')
+    counts = bot.week_availability(today, 'haircut')
+    forget(days)
+    assert counts == {day: len(await bot.time_slot_keyboard(day, 'haircut')) for day in days}
+
+    def single_day_picker():
+        bot.views.date_picker(today)
+
+    def week_picker():
+        # service_selected
+        free = bot.week_availability(today, 'haircut')
+        missing = [day for day, count in free.items() if count is None]
+        bot.views.date_picker(today, free)
+        if missing:
+            return asyncio.create_task(bot.warm_availability(missing, 'haircut'))
+
+    async def timed(picker, cache_state: str, iterations: int) -> tuple:
+        # Seconds the customer waits on both pickers, and seconds spent warming behind them
+        forget(days)
+        await bot.warm_availability(days, 'haircut')
+        elapsed = warming = 0.0
+        for _ in range(iterations):
+            if cache_state == 'cold':
+                forget(days)
+            elif cache_state == 'one day invalidated':
+                forget([chosen])
+            start = time.perf_counter()
+            background = picker()
+            elapsed += time.perf_counter() - start
+            if background is not None:  # the customer reads the picker meanwhile
+                start = time.perf_counter()
+                await background
+                warming += time.perf_counter() - start
+            start = time.perf_counter()
+            await bot.time_slot_keyboard(chosen, 'haircut')
+            elapsed += time.perf_counter() - start
+        return elapsed, warming
+
+    slower = []
+    per_round = max(1, args.iterations // args.rounds)
+    for cache_state in ('cold', 'one day invalidated', 'warm'):
+        # Interleaved rounds, best of each, so drift hits both flows alike
+        results = {single_day_picker: [], week_picker: []}
+        for _ in range(args.rounds):
+            for picker, runs in results.items():
+                runs.append(await timed(picker, cache_state, per_round))
+        (baseline, _), (elapsed, warming) = (min(runs) for runs in results.values())
+        report(f"{cache_state}, single-day path", per_round, baseline)
+        report(f"{cache_state}, week picker + time picker", per_round, elapsed)
+        if warming:
+            print(f"{'':<40} + {warming / per_round * 1e6:,.0f} us warming in the background per flow")
+        if elapsed > baseline * (1 + args.tolerance):
+            slower.append(cache_state)
+    return slower
+
+
+def _staff_day(staff: int, occupancy: float, rng) -> tuple:
+    """A roster of `staff` members with random skills, and a day of their (staff_id, start, end) bookings"""
+    members = {}
+    for i in range(staff):
+        skills = [key for key in SERVICE_KEYS if rng.random() < 0.7] or ['haircut']
+        members[f"s{i}"] = {'name': f"Staff {i}", 'services': skills}
+    rows = []
+    for staff_id in members:
+        minute = 9 * 60 + rng.randrange(0, 60, 5)
+        while minute < 18 * 60:
+            length = DURATIONS[rng.choice(SERVICE_KEYS)]
+            if rng.random() < occupancy:
+                rows.append((staff_id, minute, minute + length))
+            minute += length + rng.randrange(0, 30, 5)
+    return members, rows
+
+
+def _per_slot_staff_scan(members: dict, rows: list, service: str, duration: int) -> list:
+    """Every slot, every eligible staff member, every booking of theirs"""
+    booked = {}
+    for staff_id, start, end in rows:
+        booked.setdefault(staff_id, []).append((start, end))
+    free = []
+    for slot in range(9 * 60, 18 * 60, 30):
+        for staff_id, info in members.items():
+            if service not in info['services']:
+                continue
+            if all(not (slot < end and slot + duration > start) for start, end in booked.get(staff_id, [])):
+                free.append(slot)
+                break
+    return free
+
+
+def bench_staff_availability(args):
+    """Free times across staff for a service: per-slot loops vs per-staff bitmask operations"""
+    import random
+
+    rng = random.Random(11)
+    for occupancy in args.occupancy:
+        for staff in args.staff:
+            members, rows = _staff_day(staff, occupancy, rng)
+            roster = StaffRoster(members, SERVICE_KEYS, 9 * 60, 18 * 60)
+            booked = bookings_by_staff(rows)
+            for service in SERVICE_KEYS:
+                duration = DURATIONS[service]
+                assert roster.free_starts(booked, service, duration) == \
+                    _per_slot_staff_scan(members, rows, service, duration)
+                for slot in range(9 * 60, 18 * 60, 30):
+                    assert sorted(roster.candidates(booked, service, duration, slot)) == sorted(
+                        staff_id for staff_id in roster.eligible[service]
+                        if all(not (slot < end and slot + duration > start)
+                               for _, start, end in booked.get(staff_id, ()))
+                    )
+
+            label = f"{staff} staff, {occupancy:.0%} booked"
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                _per_slot_staff_scan(members, rows, 'color', 90)
+            report(f"per-slot scan, {label}", args.iterations, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                roster.free_starts(bookings_by_staff(rows), 'color', 90)
+            report(f"staff bitmaps, {label}", args.iterations, time.perf_counter() - start)
+
+
+# ==================== Query Plans ====================
+
+def database_reads(date: str) -> dict:
+    """Every Database read, as calls on a seeded database (see tests/test_query_plans.py)"""
+    return {
+        'get_user_appointments': lambda db: db.get_user_appointments(1000),
+        'get_appointments_by_date': lambda db: db.get_appointments_by_date(date),
+        'get_upcoming_appointments': lambda db: db.get_upcoming_appointments(),
+        'count_upcoming_appointments': lambda db: db.count_upcoming_appointments(),
+        'get_upcoming_page': lambda db: db.get_upcoming_page((date, '12:00', 5), 50),
+        'get_user_appointments_page': lambda db: db.get_user_appointments_page(1000, (date, '12:00', 5), None, 10),
+        'get_user_appointments_page prev': lambda db: db.get_user_appointments_page(1000, None, (date, '12:00', 5), 10),
+        'count_appointments_by_date': lambda db: db.count_appointments_by_date(date),
+        'get_appointments_by_date_page': lambda db: db.get_appointments_by_date_page(date, (720, 5), None, 10),
+        'get_appointments_by_date_page prev': lambda db: db.get_appointments_by_date_page(date, None, (720, 5), 10),
+        'get_booked_intervals': lambda db: db.get_booked_intervals(date),
+        'get_booked_intervals_between': lambda db: db.get_booked_intervals_between(date, date),
+        'has_overlap': lambda db: db.has_overlap(date, 600, 630),
+        'get_user_history': lambda db: db.get_user_history(1000, 20),
+        'get_history_by_date': lambda db: db.get_history_by_date(date),
+        'get_pending_reminders': lambda db: db.get_pending_reminders((date, '12:00', 5), (date, '18:00'), 50),
+        'claim_reminders': lambda db: db.claim_reminders([1, 2, 3], 0),
+    }
+
+
+def query_plans(db: Database, call) -> list:
+    """EXPLAIN QUERY PLAN steps of every SELECT a Database call runs, parameters bound"""
+    statements = []
+    conn = db.get_connection()
+    conn.set_trace_callback(statements.append)
+    try:
+        call(db)
+    finally:
+        conn.set_trace_callback(None)
+    return [
+        [row['detail'] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}')]
+        for sql in statements if sql.lstrip().upper().startswith('SELECT')
+    ]
+
+
+def uses_index(plan: list) -> bool:
+    """A query plan that reads through an index and never scans appointments in full"""
+    indexed = any('USING' in step and ('INDEX' in step or 'PRIMARY KEY' in step) for step in plan)
+    full_scan = any(step.startswith('SCAN appointments') and 'INDEX' not in step for step in plan)
+    return indexed and not full_scan
+
+
+def bench_query_plans(args):
+    """Print the query plan of every Database read (exits 1 on a full table scan)"""
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        db = Database(temp_db_path(directory))
+        seed_appointments(db, args.rows)
+        db.get_connection().execute('ANALYZE')
+
+        for name, call in database_reads(datetime.now().strftime('%Y-%m-%d')).items():
+            for plan in query_plans(db, call):
+                ok = uses_index(plan)
+                failures += not ok
+                print(f"{'ok  ' if ok else 'FAIL'} {name:<36} {' | '.join(plan)}")
+        db.close()
+
+    if failures:
+        sys.exit(1)
+
+
+# ==================== Reservation Stress ====================
+
+def reserve_concurrently(db: Database, attempts: int, threads: int, staff_ids: Optional[list] = None,
+                         date: str = '2099-01-01') -> list:
+    """reserve_slot from `threads` threads at once, all at one 30-minute slot; the Reservations"""
+    def attempt(i: int):
+        # Half the attempts overlap the slot rather than hitting it exactly
+        time_str = '10:00' if i % 2 == 0 else '10:15'
+        return db.reserve_slot(i, 'haircut', date, time_str, f"User {i}", "+1", 30, staff_ids)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(attempt, range(attempts)))
+
+
+def bench_reserve_stress(args):
+    """Fire parallel reservations at one slot; exactly one per staff member must win (exits 1 otherwise)"""
+    date = '2099-01-01'
+    staff_ids = [f"s{i}" for i in range(args.staff)] if args.staff else None
+    expected = min(args.staff or 1, args.attempts)
+    with tempfile.TemporaryDirectory() as directory:
+        db = Database(temp_db_path(directory))
+        start = time.perf_counter()
+        results = reserve_concurrently(db, args.attempts, args.threads, staff_ids, date)
+        elapsed = time.perf_counter() - start
+
+        winners = [r for r in results if r.ok]
+        stored = db.get_appointments_by_date(date)
+        db.close()
+
+    report(f"reservations ({args.threads} threads)", args.attempts, elapsed)
+    print(f"successful: {len(winners)}, conflicts: {len(results) - len(winners)}, rows stored: {len(stored)}")
+    booked_staff = {row['staff_id'] for row in stored}
+    if len(winners) != expected or len(stored) != expected or len(booked_staff) != len(stored):
+        print(f"FAIL: expected exactly {expected} booking(s), one per staff member")
+        sys.exit(1)
+
+
+# ==================== Update Scheduling ====================
+
+def _conversation(user_id: int, date: str, time_str: str) -> list:
+    """The synthetic updates of one customer's booking conversation, booking `date` at `time_str`"""
+    return [
+        message_update(0, user_id, '/start'),
+        callback_update(0, user_id, 'book'),
+        message_update(0, user_id, f'Customer {user_id}'),
+        message_update(0, user_id, f'+1555{user_id:07d}'),
+        callback_update(0, user_id, 'service_haircut'),
+        callback_update(0, user_id, f'date_{date}'),
+        callback_update(0, user_id, f'time_{time_str}'),
+    ]
+
+
+async def _free_haircut_slots(bot) -> list:
+    """(date, time) of every free haircut start of the next week, today left out"""
+    from availability import mask_minutes
+
+    today = datetime.now().date()
+    slots = []
+    for day, _ in bot.views.week(today):
+        if day == today.isoformat():
+            continue
+        free = (await bot.compute_availability([day], 'haircut'))[day]
+        slots.extend((day, to_time_str(minute)) for minute in mask_minutes(free))
+    return slots
+
+
+async def _drive_conversations(bot, workers: int, slots: list, first_user: int) -> tuple:
+    """One booking conversation per slot through bot.process_update and an UpdateQueue
+
+    All updates are queued up front, interleaved across users, as a burst
+    of fast typists would arrive. Returns the seconds to drain the queue,
+    each user's slot, how often two updates of one chat ran at once, and
+    how many updates failed.
+    """
+    from telegram import Update
+
+    booked = {first_user + i: slot for i, slot in enumerate(slots)}
+    conversations = {user_id: _conversation(user_id, *slot) for user_id, slot in booked.items()}
+
+    in_flight = set()
+    overlaps = 0
+
+    async def process(update: Update):
+        nonlocal overlaps
+        chat_id = update.effective_chat.id
+        if chat_id in in_flight:
+            overlaps += 1  # two updates of one chat running at once
+        in_flight.add(chat_id)
+        try:
+            await bot.process_update(update)
+        finally:
+            in_flight.discard(chat_id)
+
+    steps = len(next(iter(conversations.values())))
+    queue = UpdateQueue(process, maxsize=len(slots) * steps, workers=workers)
+    queue.start()
+    update_id = first_user * steps
+    start = time.perf_counter()
+    for step in range(steps):
+        for conversation in conversations.values():
+            update_id += 1
+            assert queue.submit(Update.de_json({**conversation[step], 'update_id': update_id}, bot.app_bot.bot))
+    await queue.stop(timeout=600)
+    elapsed = time.perf_counter() - start
+    return elapsed, booked, overlaps, queue.failed
+
+
+def _misbooked(bot, booked: dict) -> int:
+    """Users without exactly one booking of their own slot, under their own name and phone"""
+    rows = {}
+    for day in sorted({date for date, _ in booked.values()}):
+        for row in bot.db.database.get_appointments_by_date(day):
+            rows.setdefault(row['telegram_id'], []).append(row)
+    wrong = 0
+    for user_id, (date, time_str) in booked.items():
+        mine = rows.get(user_id, [])
+        wrong += not (len(mine) == 1 and (mine[0]['date'], mine[0]['time']) == (date, time_str)
+                      and mine[0]['name'] == f'Customer {user_id}' and mine[0]['phone'] == f'+1555{user_id:07d}')
+    return wrong
+
+
+async def _conversations(args, directory: str) -> list:
+    stub = _StubTelegram(latency=args.api_ms / 1000)
+    stub_port = _free_port()
+    stub_server = await _serve(stub.app, stub_port)
+    bot = import_bot(temp_db_path(directory),
+                     TELEGRAM_API_URL=f'http://127.0.0.1:{stub_port}',
+                     OUTBOUND_RATE=str(args.api_rate),
+                     OUTBOUND_CHAT_RATE=str(args.api_rate),
+                     NO_PROXY='127.0.0.1,localhost')
+
+    results = []
+    try:
+        slots = await _free_haircut_slots(bot)
+        if args.users > len(slots):
+            raise ValueError(f"only {len(slots)} free haircut slots this week for {args.users} users")
+        async with bot.lifespan(bot.app):
+            for run, workers in enumerate(args.workers):
+                elapsed, booked, overlaps, failed = await _drive_conversations(
+                    bot, workers, slots[:args.users], 10000 * (run + 1))
+                results.append((workers, elapsed, overlaps, failed, _misbooked(bot, booked)))
+                # Free the slots again for the next worker count
+                with bot.db.database.transaction() as conn:
+                    conn.execute('DELETE FROM appointments')
+                for date in {date for date, _ in booked.values()}:
+                    bot.slot_cache.invalidate(date)
+    finally:
+        stub_server.should_exit = True
+        await stub_server.task
+    return results
+
+
+def bench_conversations(args):
+    """Booking conversations per second through bot.process_update: one worker vs per-chat ordered workers"""
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            results = asyncio.run(_conversations(args, directory))
+        except ValueError as e:
+            sys.exit(str(e))
+
+    problems = 0
+    for workers, elapsed, overlaps, failed, misbooked in results:
+        report(f"{args.users} users, {workers} worker(s), updates", args.users * len(_conversation(0, '', '')), elapsed)
+        print(f"{'':<40} {args.users / elapsed:>12,.1f} conversations/s, chats run concurrently: {overlaps}, "
+              f"failed updates: {failed}, users without their booking: {misbooked}")
+        problems += overlaps + failed + misbooked
+    if problems:
+        sys.exit(1)
+
+
+# ==================== Prebuilt Views ====================
+
+SERVICE_CONFIG = {
+    'haircut': {'name': 'Haircut', 'duration': 30, 'price': 25},
+    'beard': {'name': 'Beard Trim', 'duration': 20, 'price': 15},
+    'color': {'name': 'Hair Color', 'duration': 90, 'price': 80},
+    'style': {'name': 'Wash & Style', 'duration': 45, 'price': 40}
+}
+
+
+def _legacy_views(services: dict, is_admin: bool):
+    """What start/get_phone/service_selected/admin_panel built on every update"""
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+    keyboard = [
+        [InlineKeyboardButton("📅 Book Appointment", callback_data='book')],
+        [InlineKeyboardButton("📋 My Bookings", callback_data='mybookings')],
+    ]
+    if is_admin:
+        keyboard.append([InlineKeyboardButton("⚙️ Admin", callback_data='admin')])
+    main_menu = InlineKeyboardMarkup(keyboard)
+
+    service_keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"{service['name']} - ${service['price']} ({service['duration']}min)",
+                              callback_data=f'service_{key}')]
+        for key, service in services.items()
+    ])
+
+    keyboard = []
+    today = datetime.now()
+    for i in range(7):
+        date = today + timedelta(days=i)
+        if date.weekday() not in [6]:
+            keyboard.append([InlineKeyboardButton(date.strftime('%a, %b %d'),
+                                                  callback_data=f"date_{date.strftime('%Y-%m-%d')}")])
+    date_picker = InlineKeyboardMarkup(keyboard)
+
+    admin_panel = InlineKeyboardMarkup([
+        [InlineKeyboardButton("📊 Today's Bookings", callback_data='admin_today')],
+        [InlineKeyboardButton("📅 Tomorrow's Bookings", callback_data='admin_tomorrow')],
+        [InlineKeyboardButton("📤 Forward All Bookings", callback_data='admin_forward')],
+        [InlineKeyboardButton("⬅️ Back", callback_data='back')]
+    ])
+    service = services['haircut']
+    text = (f"Great choice! ✨\n\nService: *{service['name']}*\n"
+            f"Duration: {service['duration']} minutes\nPrice: ${service['price']}\n\n📅 *Select a Date:*")
+    return main_menu, service_keyboard, date_picker, admin_panel, text
+
+
+def _prebuilt_views(views, is_admin: bool):
+    """The same objects from the prebuilt Views"""
+    import views as views_module
+    return (views.main_menu(is_admin), views.service_keyboard, views.date_picker(datetime.now().date()),
+            views_module.ADMIN_PANEL_KEYBOARD, views.service_texts['haircut'])
+
+
+def bench_views(args):
+    """Handler CPU time spent on keyboards/templates: rebuilt per update vs prebuilt"""
+    from catalog import Catalog
+    from views import Views
+
+    catalog = Catalog(SERVICE_CONFIG, {'start': 9, 'end': 18}, [6], {})
+    views = Views(catalog.services, catalog.closed_days)
+    assert [v.to_dict() if hasattr(v, 'to_dict') else v for v in _legacy_views(SERVICE_CONFIG, True)] == \
+        [v.to_dict() if hasattr(v, 'to_dict') else v for v in _prebuilt_views(views, True)]
+
+    for label, build in (("rebuilt per update", lambda i: _legacy_views(SERVICE_CONFIG, i % 2 == 0)),
+                         ("prebuilt", lambda i: _prebuilt_views(views, i % 2 == 0))):
+        start = time.process_time()
+        for i in range(args.updates):
+            build(i)
+        elapsed = time.process_time() - start
+        print(f"{label:<24} {elapsed / args.updates * 1e6:8.2f} us CPU per update (all five views)")
+
+
+# ==================== Outbound Rate Limiting ====================
+
+class _FakeTelegram:
+    """Bot API stand-in that answers 429 (RetryAfter) beyond `rate` calls per second"""
+
+    def __init__(self, rate: int, latency: float):
+        self.rate = rate
+        self.latency = latency
+        self.recent = deque()
+        self.flooded = 0
+
+    async def call(self, endpoint: str, data: dict):
+        from telegram.error import RetryAfter
+
+        await asyncio.sleep(self.latency)
+        now = time.monotonic()
+        while self.recent and self.recent[0] <= now - 1:
+            self.recent.popleft()
+        if len(self.recent) >= self.rate:
+            self.flooded += 1
+            raise RetryAfter(1)
+        self.recent.append(now)
+        return True
+
+
+async def _rush(limited: bool, args) -> tuple:
+    """Every customer confirms at once: edits to each customer plus one admin notification each"""
+    from telegram.error import RetryAfter
+    from outbound import OutboundRateLimiter, USER, BACKGROUND
+
+    api = _FakeTelegram(args.api_rate, args.latency_ms / 1000)
+    limiter = OutboundRateLimiter(overall_rate=args.api_rate, chat_rate=args.chat_rate, chat_burst=args.edits)
+    waits = {USER: [], BACKGROUND: []}
+    dropped = 0
+
+    async def send(endpoint: str, chat_id: int, priority: int):
+        nonlocal dropped
+        data = {'chat_id': chat_id}
+        start = time.perf_counter()
+        try:
+            if limited:
+                await limiter.process_request(api.call, (endpoint, data), {}, endpoint, data, {'priority': priority})
+            else:
+                await api.call(endpoint, data)
+        except RetryAfter:
+            dropped += 1  # what the handlers do today: log and move on
+            return
+        waits[priority].append(time.perf_counter() - start)
+
+    sends = []
+    for chat_id in range(1, args.users + 1):
+        sends += [send('editMessageText', chat_id, USER) for _ in range(args.edits)]
+        sends.append(send('sendMessage', 0, BACKGROUND))
+
+    start = time.perf_counter()
+    await asyncio.gather(*sends)
+    elapsed = time.perf_counter() - start
+    await limiter.shutdown()
+    return elapsed, waits, dropped, api.flooded
+
+
+def bench_outbound(args):
+    """A confirmation rush against a flood-limited API: direct calls vs OutboundRateLimiter"""
+    from outbound import USER, BACKGROUND
+
+    logging.getLogger('outbound').setLevel(logging.ERROR)  # the limiter logs each 429 it retries
+    for label, limited in (("direct", False), ("rate limited", True)):
+        elapsed, waits, dropped, flooded = asyncio.run(_rush(limited, args))
+        print(f"{label:<14} {elapsed:6.2f}s  429s: {flooded:<5} dropped: {dropped:<5}", end='')
+        for name, priority in (("user", USER), ("admin", BACKGROUND)):
+            samples = waits[priority]
+            if samples:
+                print(f"  {name} p50/p95 {percentile(samples, 50) * 1000:7.1f}/{percentile(samples, 95) * 1000:7.1f} ms",
+                      end='')
+        print()
+
+
+# ==================== Webhook Load ====================
+
+BENCH_ADMIN_ID = 999000
+WEBHOOK_STEPS = ['start', 'book', 'name', 'phone', 'service', 'date', 'time']
+ADMIN_STEPS = ['admin', 'admin_today', 'admin_tomorrow', 'mybookings']
+
+
+def _free_port() -> int:
+    import socket
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def _serve(app, port: int, lifespan: str = 'off'):
+    """Run an ASGI app on localhost in this event loop; returns the uvicorn server"""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, lifespan=lifespan,
+                                           log_level='warning', access_log=False))
+    server.task = asyncio.create_task(server.serve())
+    while not server.started:
+        if server.task.done():
+            server.task.result()
+        await asyncio.sleep(0.01)
+    return server
+
+
+class _StubTelegram:
+    """Local Bot API: answers every method and queues what the bot sends to each chat"""
+
+    def __init__(self, latency: float = 0.0):
+        from fastapi import FastAPI, Request
+
+        self.calls = 0
+        self.webhook_url = ''
+        self._replies = {}  # (chat_id, method) -> asyncio.Queue of params
+        self.app = FastAPI()
+
+        @self.app.post('/bot{token}/{method}')
+        async def handle(method: str, request: Request):
+            from urllib.parse import parse_qsl
+
+            params = dict(parse_qsl((await request.body()).decode()))
+            self.calls += 1
+            if latency:
+                await asyncio.sleep(latency)  # a real round trip to Telegram
+            result = True
+            if method == 'getMe':
+                result = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+            elif method == 'getWebhookInfo':
+                result = {'url': self.webhook_url, 'has_custom_certificate': False, 'pending_update_count': 0}
+            elif method == 'setWebhook':
+                self.webhook_url = params['url']
+            elif method in ('sendMessage', 'editMessageText'):
+                chat_id = int(params['chat_id'])
+                self.replies(chat_id, method).put_nowait(params)
+                result = {'message_id': 1, 'date': int(time.time()), 'text': params.get('text', ''),
+                          'chat': {'id': chat_id, 'type': 'private'}}
+            return {'ok': True, 'result': result}
+
+    def replies(self, chat_id: int, method: str) -> asyncio.Queue:
+        return self._replies.setdefault((chat_id, method), asyncio.Queue())
+
+
+def message_update(update_id: int, user_id: int, text: str) -> dict:
+    """A private-chat text message (a command when it starts with '/'), as Telegram posts it"""
+    message = {
+        'message_id': update_id, 'date': int(time.time()), 'text': text,
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'},
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+    return {'update_id': update_id, 'message': message}
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> dict:
+    """An inline button press in a private chat, as Telegram posts it"""
+    query = {
+        'id': str(update_id), 'chat_instance': 'bench', 'data': data,
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'},
+        'message': {'message_id': 1, 'date': int(time.time()), 'text': 'menu',
+                    'chat': {'id': user_id, 'type': 'private'}},
+    }
+    return {'update_id': update_id, 'callback_query': query}
+
+
+def _buttons(reply: dict, prefix: str) -> list:
+    """callback_data of a reply's inline buttons that start with prefix"""
+    import json
+
+    markup = json.loads(reply.get('reply_markup') or '{"inline_keyboard": []}')
+    return [button['callback_data'] for row in markup['inline_keyboard'] for button in row
+            if button.get('callback_data', '').startswith(prefix)]
+
+
+class _WebhookClient:
+    """Builds synthetic updates, posts them, and times each one until the bot's reply"""
+
+    def __init__(self, post, stub: _StubTelegram, timeout: float):
+        self._post = post
+        self._stub = stub
+        self._timeout = timeout
+        self._update_id = 0
+        self.latencies = {}
+        self.errors = 0
+
+    def _next_id(self) -> int:
+        self._update_id += 1
+        return self._update_id
+
+    async def _send(self, step: str, user_id: int, update: dict, reply_method: str) -> Optional[dict]:
+        start = time.perf_counter()
+        response = await self._post(update)
+        try:
+            if response.status_code != 200:
+                raise RuntimeError(f"webhook answered {response.status_code}")
+            reply = await asyncio.wait_for(self._stub.replies(user_id, reply_method).get(), self._timeout)
+        except Exception:
+            self.errors += 1
+            return None
+        self.latencies.setdefault(step, []).append(time.perf_counter() - start)
+        return reply
+
+    async def message(self, step: str, user_id: int, text: str) -> Optional[dict]:
+        return await self._send(step, user_id, message_update(self._next_id(), user_id, text), 'sendMessage')
+
+    async def callback(self, step: str, user_id: int, data: str) -> Optional[dict]:
+        return await self._send(step, user_id, callback_update(self._next_id(), user_id, data), 'editMessageText')
+
+
+async def _book(client: _WebhookClient, user_id: int, rng) -> bool:
+    """One customer's full booking conversation, picking from the keyboards the bot sends"""
+    if not await client.message('start', user_id, '/start'):
+        return False
+    if not await client.callback('book', user_id, 'book'):
+        return False
+    if not await client.message('name', user_id, f'Customer {user_id}'):
+        return False
+    reply = await client.message('phone', user_id, '+15550100')
+    if not reply:
+        return False
+    reply = await client.callback('service', user_id, rng.choice(_buttons(reply, 'service_')))
+    if not reply:
+        return False
+    reply = await client.callback('date', user_id, rng.choice(_buttons(reply, 'date_')))
+    times = _buttons(reply, 'time_') if reply else []
+    if not times:
+        return False  # day full: the conversation ends here
+    return await client.callback('time', user_id, rng.choice(times)) is not None
+
+
+async def _browse_admin(client: _WebhookClient, rounds: int):
+    """The admin flipping through the admin panel while customers book"""
+    for _ in range(rounds):
+        for step in ADMIN_STEPS:
+            await client.callback(step, BENCH_ADMIN_ID, step)
+
+
+async def _webhook_load(args, directory: str):
+    import random
+
+    import httpx
+
+    stub = _StubTelegram()
+    stub_port = _free_port()
+    stub_server = await _serve(stub.app, stub_port)
+
+    bot = import_bot(temp_db_path(directory),
+                     TELEGRAM_API_URL=f'http://127.0.0.1:{stub_port}',
+                     OUTBOUND_RATE=str(args.api_rate),
+                     OUTBOUND_CHAT_RATE=str(args.api_rate),
+                     NO_PROXY='127.0.0.1,localhost')
+
+    bot_server = None
+    if args.transport == 'http':
+        bot_port = _free_port()
+        bot_server = await _serve(bot.app, bot_port, lifespan='on')
+        http = httpx.AsyncClient(base_url=f'http://127.0.0.1:{bot_port}', timeout=args.timeout)
+        lifespan = None
+    else:
+        http = httpx.AsyncClient(transport=httpx.ASGITransport(app=bot.app), base_url='http://bench')
+        lifespan = bot.lifespan(bot.app)
+        await lifespan.__aenter__()
+
+    client = _WebhookClient(lambda update: http.post('/webhook', json=update), stub, args.timeout)
+    rng = random.Random(42)
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *[_book(client, 1000 + user, rng) for user in range(args.users)],
+        _browse_admin(client, args.admin_rounds)
+    )
+    elapsed = time.perf_counter() - start
+    health = (await http.get('/')).json()
+
+    await http.aclose()
+    if lifespan is not None:
+        await lifespan.__aexit__(None, None, None)
+    for server in (bot_server, stub_server):
+        if server is not None:
+            server.should_exit = True
+            await server.task
+    return client, sum(results[:-1]), elapsed, health, stub.calls
+
+
+def bench_webhook_load(args):
+    """Full booking and admin flows through /webhook against a local Bot API stub"""
+    with tempfile.TemporaryDirectory() as directory:
+        client, booked, elapsed, health, api_calls = asyncio.run(_webhook_load(args, directory))
+
+    updates = sum(len(samples) for samples in client.latencies.values())
+    print(f"{args.users} customers, {args.admin_rounds} admin rounds, {args.transport} transport")
+    report("updates (POST to reply)", updates, elapsed)
+    print(f"{'':<40} {booked} bookings confirmed, {client.errors} errors, {api_calls} Bot API calls")
+    print(f"{'step':<16} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+
+    slow = []
+    for step in WEBHOOK_STEPS + ADMIN_STEPS:
+        samples = client.latencies.get(step)
+        if not samples:
+            continue
+        p50, p95, p99 = (percentile(samples, pct) * 1000 for pct in (50, 95, 99))
+        print(f"{step:<16} {len(samples):>7} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f}")
+        if args.max_p99_ms is not None and p99 > args.max_p99_ms:
+            slow.append(step)
+    print(f"update queue: {health['update_queue']}")
+
+    if client.errors or slow:
+        if slow:
+            print(f"p99 above {args.max_p99_ms} ms: {', '.join(slow)}")
+        sys.exit(1)
+
+
+# ==================== Startup ====================
+
+async def _boot_once(args, stub: _StubTelegram, stub_port: int, db_path: str, fast: bool):
+    """Start `python bot.py`, post /start until it answers; seconds to the ack and to the reply"""
+    import subprocess
+
+    import httpx
+
+    bot_port = _free_port()
+    env = dict(os.environ,
+               BOT_TOKEN='123456:bench',
+               ADMIN_TELEGRAM_ID=str(BENCH_ADMIN_ID),
+               WEBHOOK_URL=f'http://127.0.0.1:{bot_port}',
+               TELEGRAM_API_URL=f'http://127.0.0.1:{stub_port}',
+               DATABASE_PATH=db_path,
+               PORT=str(bot_port),
+               FAST_START='1' if fast else '0',
+               NO_PROXY='127.0.0.1,localhost')
+    user_id = 1000 + stub.calls  # a fresh chat per boot
+    update = {
+        'update_id': user_id,
+        'message': {'message_id': 1, 'date': int(time.time()), 'text': '/start',
+                    'chat': {'id': user_id, 'type': 'private'},
+                    'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench'},
+                    'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}]},
+    }
+
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'bot.py'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{bot_port}', timeout=args.timeout) as http:
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"bot.py exited with {process.returncode}")
+                if time.perf_counter() - start > args.timeout:
+                    raise RuntimeError("bot.py did not answer in time")
+                try:
+                    response = await http.post('/webhook', json=update)
+                except httpx.TransportError:
+                    await asyncio.sleep(0.005)  # not listening yet
+                    continue
+                if response.status_code == 200:
+                    break
+                await asyncio.sleep(0.005)
+            acked = time.perf_counter() - start
+            await asyncio.wait_for(stub.replies(user_id, 'sendMessage').get(), args.timeout)
+            replied = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+    return acked, replied
+
+
+async def _startup(args, directory: str):
+    stub = _StubTelegram(latency=args.api_latency_ms / 1000)
+    stub_port = _free_port()
+    stub_server = await _serve(stub.app, stub_port)
+
+    results = {}
+    for fast in (False, True):
+        db_path = os.path.join(directory, f"{'fast' if fast else 'default'}.db")
+        stub.webhook_url = ''  # the first boot registers the webhook, later ones find it set
+        results[fast] = [await _boot_once(args, stub, stub_port, db_path, fast) for _ in range(args.boots)]
+
+    stub_server.should_exit = True
+    await stub_server.task
+    return results
+
+
+def bench_startup(args):
+    """Process start to first webhook ack and first reply, with and without FAST_START"""
+    with tempfile.TemporaryDirectory() as directory:
+        results = asyncio.run(_startup(args, directory))
+
+    print(f"{args.boots} boots per mode, {args.api_latency_ms:.0f} ms per Bot API call; "
+          f"the first boot of each mode creates the database and sets the webhook")
+    print(f"{'mode':<12} {'boot':<6} {'ack ms':>9} {'reply ms':>9}")
+    for fast, boots in results.items():
+        mode = 'FAST_START' if fast else 'default'
+        print(f"{mode:<12} {'first':<6} {boots[0][0] * 1000:>9.0f} {boots[0][1] * 1000:>9.0f}")
+        if len(boots) > 1:
+            acked = percentile([ack for ack, _ in boots[1:]], 50)
+            replied = percentile([reply for _, reply in boots[1:]], 50)
+            print(f"{mode:<12} {'median':<6} {acked * 1000:>9.0f} {replied * 1000:>9.0f}")
+
+
+# ==================== Database Scale ====================
+
+SCALE_PAST_DAYS = 2 * 365
+SCALE_FUTURE_DAYS = 365
+SCALE_BATCH = 50000
+
+
+def _scale_rows(count: int, rng):
+    """Realistic appointment rows: skewed users, three years of dates, mixed statuses"""
+    users = max(100, count // 25)
+    today = datetime.now().date()
+    for i in range(count):
+        day = rng.randint(-SCALE_PAST_DAYS, SCALE_FUTURE_DAYS)
+        service = rng.choice(SERVICE_KEYS)
+        start_min = 9 * 60 + 30 * rng.randrange(18)
+        if day < 0:
+            status = 'cancelled' if rng.random() < 0.15 else 'completed'
+        else:
+            status = 'cancelled' if rng.random() < 0.10 else 'confirmed'
+        user = 100000 + int(users * rng.random() ** 1.5)  # a few heavy users, a long tail of light ones
+        yield (user, f"User {user}", "+15550100", service, (today + timedelta(days=day)).isoformat(),
+               f"{start_min // 60:02d}:{start_min % 60:02d}", start_min, start_min + DURATIONS[service],
+               DURATIONS[service], status)
+
+
+def _populate(db: Database, count: int, rng):
+    rows = _scale_rows(count, rng)
+    while True:
+        batch = [row for _, row in zip(range(SCALE_BATCH), rows)]
+        if not batch:
+            return
+        with db.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO appointments (telegram_id, name, phone, service, date, time,
+                                          start_min, end_min, duration, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', batch)
+
+
+def _time_operation(call, iterations: int) -> dict:
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        call(i)
+        samples.append(time.perf_counter() - start)
+    return {
+        'iterations': iterations,
+        'ops_per_sec': round(iterations / sum(samples), 1),
+        'mean_us': round(sum(samples) / iterations * 1e6, 1),
+        'p50_us': round(percentile(samples, 50) * 1e6, 1),
+        'p95_us': round(percentile(samples, 95) * 1e6, 1),
+        'p99_us': round(percentile(samples, 99) * 1e6, 1),
+    }
+
+
+def _scale_run(count: int, args, directory: str) -> dict:
+    import random
+
+    rng = random.Random(count)
+    path = os.path.join(directory, f'scale-{count}.db')
+    db = Database(path)
+    db.init_database()
+    start = time.perf_counter()
+    _populate(db, count, rng)
+    db.get_connection().execute('ANALYZE')
+    populate_seconds = time.perf_counter() - start
+
+    conn = db.get_connection()
+    heavy_user = conn.execute(
+        'SELECT telegram_id FROM appointments GROUP BY telegram_id ORDER BY COUNT(*) DESC LIMIT 1'
+    ).fetchone()[0]
+    users = [row[0] for row in conn.execute('SELECT DISTINCT telegram_id FROM appointments LIMIT 1000')]
+    today = datetime.now().date()
+    dates = [(today + timedelta(days=rng.randrange(SCALE_FUTURE_DAYS))).isoformat() for _ in range(256)]
+
+    def slot(i):
+        return dates[i % len(dates)], 9 * 60 + 30 * (i % 18)
+
+    operations = {
+        'get_user_appointments': lambda i: db.get_user_appointments(users[i % len(users)]),
+        'get_user_appointments (heaviest user)': lambda i: db.get_user_appointments(heavy_user),
+        'get_appointments_by_date': lambda i: db.get_appointments_by_date(dates[i % len(dates)]),
+        'get_booked_intervals': lambda i: db.get_booked_intervals(dates[i % len(dates)]),
+        'has_overlap': lambda i: db.has_overlap(slot(i)[0], slot(i)[1], slot(i)[1] + 30),
+        'create_appointment': lambda i: db.create_appointment(
+            users[i % len(users)], 'haircut', slot(i)[0], to_time_str(slot(i)[1]), "Bench", "+15550100", 30),
+        'reserve_slot': lambda i: db.reserve_slot(
+            users[i % len(users)], 'beard', slot(i)[0], '08:00', "Bench", "+15550100", 20),
+    }
+    results = {name: _time_operation(call, args.iterations) for name, call in operations.items()}
+    db.close()
+
+    return {
+        'rows': count,
+        'populate_seconds': round(populate_seconds, 2),
+        'file_mb': round(os.path.getsize(path) / 2 ** 20, 1),
+        'operations': results,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    import subprocess
+
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_db_scale(args):
+    """Database reads and writes at growing table sizes, optionally as JSON for diffing"""
+    import json
+    import platform
+
+    runs = []
+    with tempfile.TemporaryDirectory() as directory:
+        for count in args.rows:
+            run = _scale_run(count, args, directory)
+            runs.append(run)
+            print(f"{count:,} rows ({run['file_mb']} MB, generated in {run['populate_seconds']}s)")
+            for name, stats in run['operations'].items():
+                print(f"  {name:<38} {stats['ops_per_sec']:>10,.0f} ops/s  "
+                      f"p50 {stats['p50_us']:>8.1f} us  p99 {stats['p99_us']:>8.1f} us")
+
+    if args.json:
+        document = {
+            'benchmark': 'db-scale',
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'iterations': args.iterations,
+            'runs': runs,
+        }
+        text = json.dumps(document, indent=2, sort_keys=True)
+        if args.json == '-':
+            print(text)
+        else:
+            with open(args.json, 'w') as f:
+                f.write(text + '\n')
+            print(f"Results written to {args.json}")
+
+
+# ==================== Metrics Overhead ====================
+
+def bench_metrics(args):
+    """Cost of recording a metric on the hot path, and of rendering /metrics"""
+    from metrics import Registry
+
+    registry = Registry()
+    counter = registry.counter('bench_total', 'Bench counter', ['handler'])
+    histogram = registry.histogram('bench_seconds', 'Bench histogram', ['handler'])
+    handlers = [f'handler_{i}' for i in range(args.series)]
+
+    for label, record in (("Counter.inc", lambda i: counter.inc(handlers[i % args.series])),
+                          ("Histogram.observe", lambda i: histogram.observe(0.003, handlers[i % args.series]))):
+        start = time.perf_counter()
+        for i in range(args.operations):
+            record(i)
+        elapsed = time.perf_counter() - start
+        print(f"{label:<24} {elapsed / args.operations * 1e9:8.0f} ns per call")
+
+    start = time.perf_counter()
+    text = registry.render()
+    print(f"{'render':<24} {(time.perf_counter() - start) * 1000:8.2f} ms for {args.series} series "
+          f"({len(text.splitlines())} lines)")
+
+
+def bench_profiling(args):
+    """Per-update cost of the profiling hooks: off, slow-update tracing, sampling"""
+    from types import SimpleNamespace
+    from profiling import Profiler, current_trace
+
+    logging.getLogger('profiling').setLevel(logging.ERROR)
+
+    async def handle(profiler: Profiler, update):
+        with profiler.trace(update):
+            for _ in range(args.hooks):
+                # What AsyncDatabase._run and the outbound limiter do per call
+                trace = current_trace.get()
+                if trace is not None:
+                    trace.add_db(0.0)
+
+    async def run(profiler: Profiler) -> float:
+        profiler.start()
+        start = time.perf_counter()
+        for update_id in range(args.updates):
+            update = SimpleNamespace(update_id=update_id, message=object())
+            profiler.received(update, time.perf_counter())
+            await handle(profiler, update)
+        elapsed = time.perf_counter() - start
+        profiler.stop()
+        return elapsed
+
+    with tempfile.TemporaryDirectory() as directory:
+        modes = (("off", Profiler()),
+                 ("slow-update tracing", Profiler(slow_ms=1000)),
+                 ("sampling 100%", Profiler(sample_rate=1.0, directory=directory)))
+        baseline = None
+        for label, profiler in modes:
+            elapsed = asyncio.run(run(profiler))
+            per_update = elapsed / args.updates * 1e6
+            baseline = per_update if baseline is None else baseline
+            print(f"{label:<22} {per_update:8.2f} µs per update (+{per_update - baseline:.2f})")
+
+
+# ==================== Archival ====================
+
+def bench_archive(args):
+    """Archival batch times, and hot-table reads and writes before and after archiving"""
+    import random
+
+    rng = random.Random(7)
+    today = datetime.now().date()
+    before_date = (today - timedelta(days=args.keep_days)).isoformat()
+    dates = [(today + timedelta(days=rng.randrange(SCALE_FUTURE_DAYS))).isoformat() for _ in range(256)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = temp_db_path(directory)
+        db = Database(path)
+        _populate(db, args.rows, rng)
+        db.get_connection().execute('ANALYZE')
+        users = [row[0] for row in db.get_connection().execute(
+            'SELECT DISTINCT telegram_id FROM appointments LIMIT 1000')]
+
+        operations = {
+            'get_user_appointments': lambda i: db.get_user_appointments(users[i % len(users)]),
+            'count_upcoming_appointments': lambda i: db.count_upcoming_appointments(),
+            'get_booked_intervals_between': lambda i: db.get_booked_intervals_between(
+                dates[i % len(dates)], (datetime.fromisoformat(dates[i % len(dates)]) + timedelta(days=6)).date().isoformat()),
+            'has_overlap': lambda i: db.has_overlap(dates[i % len(dates)], 600, 630),
+            'create_appointment': lambda i: db.create_appointment(
+                users[i % len(users)], 'haircut', dates[i % len(dates)], '08:00', "Bench", "+15550100", 30),
+        }
+        before = {name: _time_operation(call, args.iterations) for name, call in operations.items()}
+        hot_before = db.count_archive()['hot']
+        size_before = os.path.getsize(path)
+
+        batches = []
+        while True:
+            start = time.perf_counter()
+            moved = db.archive_appointments(before_date, args.batch_size)
+            batches.append(time.perf_counter() - start)
+            if moved < args.batch_size:
+                break
+        start = time.perf_counter()
+        compacted = db.compact(10 ** 9)
+        compact_seconds = time.perf_counter() - start
+        counts = db.count_archive()
+
+        after = {name: _time_operation(call, args.iterations) for name, call in operations.items()}
+        size_after = os.path.getsize(path)
+        history = _time_operation(lambda i: db.get_user_history(users[i % len(users)], 20), args.iterations)
+        db.close()
+
+    print(f"{args.rows} rows: {hot_before} hot before, {counts['hot']} hot and {counts['archived']} archived after")
+    print(f"archived in {len(batches)} batches of {args.batch_size}: {sum(batches):.2f} s, "
+          f"batch p50 {percentile(batches, 50) * 1000:.1f} ms, max {max(batches) * 1000:.1f} ms (write lock held)")
+    print(f"compact: {compact_seconds * 1000:.0f} ms, {compacted['pages_released']} pages released, "
+          f"file {size_before / 2 ** 20:.1f} -> {size_after / 2 ** 20:.1f} MB")
+    print(f"{'operation':<32} {'p50 us before':>14} {'p50 us after':>13}")
+    for name in operations:
+        print(f"{name:<32} {before[name]['p50_us']:>14.1f} {after[name]['p50_us']:>13.1f}")
+    print(f"{'get_user_history (archive too)':<32} {'':>14} {history['p50_us']:>13.1f}")
+
+
+# ==================== Reminders ====================
+
+async def _remind_backlog(args, path: str, total: int) -> tuple:
+    from scheduler import ReminderScheduler
+
+    received = Counter()
+    running = []
+
+    async def send(reminder: dict):
+        await asyncio.sleep(args.latency / 1000)
+        received[reminder['id']] += 1
+
+    def scheduler() -> ReminderScheduler:
+        reminders = ReminderScheduler(AsyncDatabase(Database(path)), send, batch_size=args.batch_size,
+                                      rescan_interval=1.0, claim_timeout=1.0)
+        reminders.start()
+        running.append(reminders)
+        return reminders
+
+    start = time.perf_counter()
+    first, _ = scheduler(), scheduler()
+    while len(received) < total // 2:
+        await asyncio.sleep(0.001)
+    # A restart: the first process goes away mid-batch, a new one takes its place
+    await first.stop()
+    running.remove(first)
+    first.db.close()
+    scheduler()
+    while len(received) < total and time.perf_counter() - start < args.timeout:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+
+    stats = [reminders.stats() for reminders in running] + [first.stats()]
+    for reminders in running:
+        await reminders.stop()
+        reminders.db.close()
+    return received, elapsed, stats
+
+
+def bench_reminders(args):
+    """Send a backlog of due reminders from two schedulers with a restart; none may be missed (exits 1)"""
+    now = datetime.now()
+    rows = []
+    for i in range(args.reminders):
+        start = now + timedelta(minutes=2 + i * (20 * 60) // args.reminders)  # all within the next day
+        rows.append((1000 + i, f"User {i}", "+1", SERVICE_KEYS[i % len(SERVICE_KEYS)],
+                     start.strftime('%Y-%m-%d'), start.strftime('%H:%M')))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = temp_db_path(directory)
+        db = Database(path)
+        with db.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO appointments (telegram_id, name, phone, service, date, time, status)
+                VALUES (?, ?, ?, ?, ?, ?, 'confirmed')
+            ''', rows)
+        ids = [row[0] for row in db.get_connection().execute('SELECT id FROM appointments')]
+        received, elapsed, stats = asyncio.run(_remind_backlog(args, path, len(ids)))
+        unrecorded = db.get_connection().execute(
+            'SELECT COUNT(*) FROM appointments WHERE reminder_sent_at IS NULL').fetchone()[0]
+        db.close()
+
+    missed = [i for i in ids if received[i] == 0]
+    duplicates = sum(count - 1 for count in received.values() if count > 1)
+    report(f"{len(ids)} reminders, {args.latency:g} ms sends", len(ids) - len(missed), elapsed)
+    print(f"batches {sum(s['batches'] for s in stats)}, loaded {sum(s['loaded'] for s in stats)} "
+          f"(rescans included), duplicates {duplicates}, missed {len(missed)}, not recorded {unrecorded}")
+    if missed or unrecorded:
+        sys.exit(1)
+
+
+# ==================== Entry Point ====================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    p = subparsers.add_parser('connections', help=bench_connections.__doc__)
+    p.add_argument('--rows', type=int, default=200)
+    p.add_argument('--queries', type=int, default=5000)
+    p.add_argument('--writes', type=int, default=500)
+    p.set_defaults(func=bench_connections)
+
+    p = subparsers.add_parser('event-loop', help=bench_event_loop.__doc__)
+    p.add_argument('--seconds', type=float, default=2.0)
+    p.add_argument('--interval', type=float, default=5.0, help="ms between probe requests")
+    p.add_argument('--writers', type=int, default=4)
+    p.add_argument('--write-stall-ms', type=float, default=10.0)
+    p.set_defaults(func=bench_event_loop)
+
+    p = subparsers.add_parser('availability', help=bench_availability.__doc__)
+    p.add_argument('--bookings', type=int, nargs='+', default=[10, 100, 1000])
+    p.add_argument('--iterations', type=int, default=50)
+    p.set_defaults(func=bench_availability)
+
+    p = subparsers.add_parser('week-availability', help=bench_week_availability.__doc__)
+    p.add_argument('--rows', type=int, default=900)
+    p.add_argument('--days', type=int, default=60, help="days the bookings are spread over")
+    p.add_argument('--iterations', type=int, default=2000)
+    p.add_argument('--rounds', type=int, default=100, help="interleaved rounds per flow, the best one counts")
+    p.add_argument('--tolerance', type=float, default=0.1,
+                   help="relative slowdown allowed: warm, the week picker still reads the week from the slot cache")
+    p.set_defaults(func=bench_week_availability)
+
+    p = subparsers.add_parser('staff-availability', help=bench_staff_availability.__doc__)
+    p.add_argument('--staff', type=int, nargs='+', default=[1, 5, 20, 50])
+    p.add_argument('--occupancy', type=float, nargs='+', default=[0.3, 0.6],
+                   help="chance each gap in a calendar is booked")
+    p.add_argument('--iterations', type=int, default=2000)
+    p.set_defaults(func=bench_staff_availability)
+
+    p = subparsers.add_parser('query-plans', help=bench_query_plans.__doc__)
+    p.add_argument('--rows', type=int, default=2000)
+    p.set_defaults(func=bench_query_plans)
+
+    p = subparsers.add_parser('reserve-stress', help=bench_reserve_stress.__doc__)
+    p.add_argument('--attempts', type=int, default=500)
+    p.add_argument('--threads', type=int, default=32)
+    p.add_argument('--staff', type=int, default=0, help="staff members to book, 0 = a single chair")
+    p.set_defaults(func=bench_reserve_stress)
+
+    p = subparsers.add_parser('conversations', help=bench_conversations.__doc__)
+    p.add_argument('--users', type=int, default=100, help="customers, each booking a different free slot")
+    p.add_argument('--workers', type=int, nargs='+', default=[1, 8, 32])
+    p.add_argument('--api-ms', type=float, default=5.0, help="latency of each Bot API call to the stub")
+    p.add_argument('--api-rate', type=float, default=1000.0,
+                   help="outbound rate limits, so the stub measures the bot rather than the limiter")
+    p.set_defaults(func=bench_conversations)
+
+    p = subparsers.add_parser('views', help=bench_views.__doc__)
+    p.add_argument('--updates', type=int, default=20000)
+    p.set_defaults(func=bench_views)
+
+    p = subparsers.add_parser('outbound', help=bench_outbound.__doc__)
+    p.add_argument('--users', type=int, default=50)
+    p.add_argument('--edits', type=int, default=3, help="edits per customer")
+    p.add_argument('--api-rate', type=int, default=30, help="calls per second the fake API accepts")
+    p.add_argument('--chat-rate', type=float, default=10.0,
+                   help="per-chat limit (Telegram's is about 1/s; raised to keep the run short)")
+    p.add_argument('--latency-ms', type=float, default=20.0)
+    p.set_defaults(func=bench_outbound)
+
+    p = subparsers.add_parser('webhook-load', help=bench_webhook_load.__doc__)
+    p.add_argument('--users', type=int, default=100, help="customers booking concurrently")
+    p.add_argument('--admin-rounds', type=int, default=20)
+    p.add_argument('--transport', choices=['asgi', 'http'], default='asgi',
+                   help="post in-process (asgi) or over local HTTP through uvicorn")
+    p.add_argument('--api-rate', type=float, default=1000.0,
+                   help="outbound rate limits, so the stub measures the bot rather than the limiter")
+    p.add_argument('--timeout', type=float, default=30.0, help="seconds to wait for each reply")
+    p.add_argument('--max-p99-ms', type=float, help="exit 1 if any step's p99 is above this")
+    p.set_defaults(func=bench_webhook_load)
+
+    p = subparsers.add_parser('startup', help=bench_startup.__doc__)
+    p.add_argument('--boots', type=int, default=5, help="process starts per mode")
+    p.add_argument('--api-latency-ms', type=float, default=100.0, help="simulated Bot API round trip")
+    p.add_argument('--timeout', type=float, default=30.0)
+    p.set_defaults(func=bench_startup)
+
+    p = subparsers.add_parser('db-scale', help=bench_db_scale.__doc__)
+    p.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    p.add_argument('--iterations', type=int, default=500, help="calls timed per operation")
+    p.add_argument('--json', metavar='PATH', help="also write results as JSON ('-' for stdout)")
+    p.set_defaults(func=bench_db_scale)
+
+    p = subparsers.add_parser('archive', help=bench_archive.__doc__)
+    p.add_argument('--rows', type=int, default=200000)
+    p.add_argument('--keep-days', type=int, default=7)
+    p.add_argument('--batch-size', type=int, default=200)
+    p.add_argument('--iterations', type=int, default=500, help="calls timed per operation")
+    p.set_defaults(func=bench_archive)
+
+    p = subparsers.add_parser('metrics', help=bench_metrics.__doc__)
+    p.add_argument('--operations', type=int, default=1000000)
+    p.add_argument('--series', type=int, default=20, help="distinct label values")
+    p.set_defaults(func=bench_metrics)
+
+    p = subparsers.add_parser('profiling', help=bench_profiling.__doc__)
+    p.add_argument('--updates', type=int, default=100000)
+    p.add_argument('--hooks', type=int, default=3, help="DB/outbound calls per update")
+    p.set_defaults(func=bench_profiling)
+
+    p = subparsers.add_parser('reminders', help=bench_reminders.__doc__)
+    p.add_argument('--reminders', type=int, default=5000)
+    p.add_argument('--batch-size', type=int, default=50)
+    p.add_argument('--latency', type=float, default=2.0, help="ms per simulated Bot API send")
+    p.add_argument('--timeout', type=float, default=60.0, help="seconds before giving up")
+    p.set_defaults(func=bench_reminders)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,16 @@ Scheduler Bot - Webhook Version
 Booking system with FastAPI webhooks for better Render performance
 """
 
+import asyncio
 import os
 import logging
+import time
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
 
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
@@ -20,11 +24,60 @@ from telegram.ext import (
     filters
 )
 
-from database import Database
+from database import Database, AsyncDatabase
+from persistence import SQLitePersistence
+from views import (
+    Views,
+    WELCOME_TEXT,
+    WELCOME_BACK_TEXT,
+    ADMIN_PANEL_TEXT,
+    CHOOSE_SERVICE_TEXT,
+    BACK_KEYBOARD,
+    BACK_TO_ADMIN_KEYBOARD,
+    CANCEL_TO_ADMIN_KEYBOARD,
+    ADMIN_PANEL_KEYBOARD,
+    MessagePacker,
+    pager_keyboard,
+)
+from webhook_queue import UpdateDeduplicator, UpdateQueue
+from outbound import OutboundRateLimiter, BACKGROUND
+from notifications import AdminNotifier
+from archive import Archiver
+from scheduler import ReminderScheduler
+from metrics import REGISTRY, SIZE_BUCKETS, instrument_handlers
+from profiling import Profiler
+from availability import (
+    AvailabilityCache, bookings_by_date, bookings_by_staff, mask_minutes, popcount, to_minutes, to_time_str
+)
+from catalog import CATALOG
 from config import BOT_TOKEN, ADMIN_TELEGRAM_ID
 
 # Configuration
 WEBHOOK_URL = os.environ.get("WEBHOOK_URL")  # Set this in Render: https://yourapp.onrender.com
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org")  # a local stub in benchmarks
+DATABASE_PATH = os.environ.get("DATABASE_PATH", "bookings.db")
+DB_WORKERS = int(os.environ.get("DB_WORKERS", 4))  # Threads running SQLite queries
+SLOT_CACHE_SIZE = int(os.environ.get("SLOT_CACHE_SIZE", 256))  # (date, service) entries
+SLOT_CACHE_TTL = float(os.environ.get("SLOT_CACHE_TTL", 300))  # seconds
+UPDATE_QUEUE_SIZE = int(os.environ.get("UPDATE_QUEUE_SIZE", 1000))  # Updates waiting for a worker
+UPDATE_WORKERS = int(os.environ.get("UPDATE_WORKERS", 4))  # Tasks processing updates
+SHUTDOWN_DRAIN_TIMEOUT = float(os.environ.get("SHUTDOWN_DRAIN_TIMEOUT", 10))  # seconds
+DEDUPE_CAPACITY = int(os.environ.get("DEDUPE_CAPACITY", 10000))  # Recent update_ids remembered
+DEDUPE_SHARED = os.environ.get("DEDUPE_SHARED", "0") == "1"  # Also dedupe across workers via SQLite
+PERSISTENCE_INTERVAL = float(os.environ.get("PERSISTENCE_INTERVAL", 2))  # seconds between writes of changes made outside updates
+VIEW_PAGE_SIZE = int(os.environ.get("VIEW_PAGE_SIZE", 10))  # bookings per My Bookings / admin day page
+OUTBOUND_RATE = float(os.environ.get("OUTBOUND_RATE", 30))  # Bot API calls per second, all chats
+OUTBOUND_CHAT_RATE = float(os.environ.get("OUTBOUND_CHAT_RATE", 1))  # messages per second to one private chat
+ADMIN_DIGEST_THRESHOLD = int(os.environ.get("ADMIN_DIGEST_THRESHOLD", 5))  # pending notifications sent as one digest
+ADMIN_DIGEST_WINDOW = float(os.environ.get("ADMIN_DIGEST_WINDOW", 10))  # seconds a notification may wait for others
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))  # fraction of updates to sample, 0 = off
+SLOW_UPDATE_MS = float(os.environ.get("SLOW_UPDATE_MS", 0))  # log a span breakdown above this, 0 = off
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")  # where sampled collapsed stacks are written
+FAST_START = os.environ.get("FAST_START", "0") == "1"  # serve webhooks before the bot and database are ready
+ARCHIVE_INTERVAL = float(os.environ.get("ARCHIVE_INTERVAL", 6 * 3600))  # seconds between archival runs, 0 = off
+ARCHIVE_KEEP_DAYS = int(os.environ.get("ARCHIVE_KEEP_DAYS", 7))  # past days kept in the hot table
+REMINDER_HOURS = float(os.environ.get("REMINDER_HOURS", 24))  # hours before an appointment to remind, 0 = off
+REMINDER_BATCH = int(os.environ.get("REMINDER_BATCH", 50))  # reminders claimed and sent together
 
 # Logging
 logging.basicConfig(
@@ -35,44 +88,38 @@ logger = logging.getLogger(__name__)
 
 # Conversation states
 GET_NAME, GET_PHONE, SELECT_SERVICE, SELECT_DATE, SELECT_TIME = range(5)
-
-# Services configuration
-SERVICES = {
-    'haircut': {'name': 'Haircut', 'duration': 30, 'price': 25},
-    'beard': {'name': 'Beard Trim', 'duration': 20, 'price': 15},
-    'color': {'name': 'Hair Color', 'duration': 90, 'price': 80},
-    'style': {'name': 'Wash & Style', 'duration': 45, 'price': 40}
+STATE_NAMES = {
+    GET_NAME: 'get_name',
+    GET_PHONE: 'get_phone',
+    SELECT_SERVICE: 'select_service',
+    SELECT_DATE: 'select_date',
+    SELECT_TIME: 'select_time',
 }
 
-BUSINESS_HOURS = {'start': 9, 'end': 18}  # 9 AM to 6 PM
-CLOSED_DAYS = [6]  # Sunday
+# Services, hours and staff, compiled once from config.py
+SERVICES = CATALOG.services
+
+# Which staff member is free when, for each service
+roster = CATALOG.roster
 
-# Database
-db = Database()
+# Keyboards and templates, prebuilt for this catalog
+views = Views(SERVICES, CATALOG.closed_days)
+
+# Database (all handler queries run on a small thread pool, off the event loop)
+db = AsyncDatabase(Database(DATABASE_PATH, lazy=FAST_START), max_workers=DB_WORKERS)
+
+# Free slots per (date, service), dropped whenever a booking touches the date
+slot_cache = AvailabilityCache(maxsize=SLOT_CACHE_SIZE, ttl=SLOT_CACHE_TTL)
+db.database.add_change_listener(slot_cache.invalidate)
 
 
 # ==================== Command Handlers ====================
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start command"""
-    keyboard = [
-        [InlineKeyboardButton("📅 Book Appointment", callback_data='book')],
-        [InlineKeyboardButton("📋 My Bookings", callback_data='mybookings')],
-    ]
-    
-    if update.message.from_user.id == ADMIN_TELEGRAM_ID:
-        keyboard.append([InlineKeyboardButton("⚙️ Admin", callback_data='admin')])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await update.message.reply_text(
-        "💈 *Welcome to Anthony Studio!*\n\n"
-        "Book your appointment in 3 easy steps:\n"
-        "1️⃣ Enter your details\n"
-        "2️⃣ Choose service & time\n"
-        "3️⃣ Confirm booking\n\n"
-        "👇 What would you like to do?",
-        reply_markup=reply_markup,
+        WELCOME_TEXT,
+        reply_markup=views.main_menu(update.message.from_user.id == ADMIN_TELEGRAM_ID),
         parse_mode='Markdown'
     )
 
@@ -89,17 +136,9 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif query.data == 'admin':
         return await admin_panel(update, context)
     elif query.data == 'back':
-        keyboard = [
-            [InlineKeyboardButton("📅 Book Appointment", callback_data='book')],
-            [InlineKeyboardButton("📋 My Bookings", callback_data='mybookings')],
-        ]
-        if query.from_user.id == ADMIN_TELEGRAM_ID:
-            keyboard.append([InlineKeyboardButton("⚙️ Admin", callback_data='admin')])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text(
-            "💈 *Welcome Back!*\n\nWhat would you like to do?",
-            reply_markup=reply_markup,
+            WELCOME_BACK_TEXT,
+            reply_markup=views.main_menu(query.from_user.id == ADMIN_TELEGRAM_ID),
             parse_mode='Markdown'
         )
 
@@ -137,22 +176,9 @@ async def get_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Get phone and show services"""
     context.user_data['phone'] = update.message.text
     
-    keyboard = []
-    for key, service in SERVICES.items():
-        keyboard.append([
-            InlineKeyboardButton(
-                f"{service['name']} - ${service['price']} ({service['duration']}min)",
-                callback_data=f'service_{key}'
-            )
-        ])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await update.message.reply_text(
-        "Perfect! 📞\n\n"
-        "Step 3 of 3\n\n"
-        "💇 *Choose Your Service:*",
-        reply_markup=reply_markup,
+        CHOOSE_SERVICE_TEXT,
+        reply_markup=views.service_keyboard,
         parse_mode='Markdown'
     )
     return SELECT_SERVICE
@@ -165,35 +191,105 @@ async def service_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     service_key = query.data.replace('service_', '')
     context.user_data['service'] = service_key
-    context.user_data['service_name'] = SERVICES[service_key]['name']
-    context.user_data['duration'] = SERVICES[service_key]['duration']
-    context.user_data['price'] = SERVICES[service_key]['price']
-    
-    # Show next 7 days
-    keyboard = []
-    today = datetime.now()
-    
-    for i in range(7):
-        date = today + timedelta(days=i)
-        if date.weekday() not in CLOSED_DAYS:
-            date_str = date.strftime('%Y-%m-%d')
-            display_date = date.strftime('%a, %b %d')
-            keyboard.append([InlineKeyboardButton(display_date, callback_data=f'date_{date_str}')])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    service = SERVICES[service_key]
+    context.user_data['service_name'] = service.name
+    context.user_data['duration'] = service.duration
+    context.user_data['price'] = service.price
+    
+    # Show the next 7 days, with free times for the ones already in the slot cache
+    today = datetime.now().date()
+    free = week_availability(today, service_key)
+    missing = [day for day, count in free.items() if count is None]
+    if missing:
+        context.application.create_task(warm_availability(missing, service_key), update=update)
+    elif not any(free.values()):
+        await query.edit_message_text(
+            "😔 Sorry, we're fully booked for the next 7 days.\n\n"
+            "Please use /start to try another service."
+        )
+        return ConversationHandler.END
     
     await query.edit_message_text(
-        f"Great choice! ✨\n\n"
-        f"Service: *{SERVICES[service_key]['name']}*\n"
-        f"Duration: {SERVICES[service_key]['duration']} minutes\n"
-        f"Price: ${SERVICES[service_key]['price']}\n\n"
-        f"📅 *Select a Date:*",
-        reply_markup=reply_markup,
+        views.service_texts[service_key],
+        reply_markup=views.date_picker(today, free),
         parse_mode='Markdown'
     )
     return SELECT_DATE
 
 
+def upcoming(date_str: str, free: int) -> int:
+    """A free start mask of a date, minus the starts already past today"""
+    now = datetime.now()
+    if date_str != now.date().isoformat():  # 'YYYY-MM-DD', without strftime's cost
+        return free
+    return free & -(1 << (now.hour * 60 + now.minute + 1))
+
+
+def week_availability(today, service: str) -> Dict[str, Optional[int]]:
+    """Number of free start times per date-picker day, None for days not in the slot cache
+
+    Never touches the database, so the date picker does not wait on it:
+    warm_availability() fills in the missing days while the customer
+    looks at the picker, and date_selected usually finds its day cached.
+    """
+    today_str = today.isoformat()
+    available = slot_cache.get_many([day for day, _ in views.week(today)], service)
+    return {
+        day: None if free is None else popcount(upcoming(day, free) if day == today_str else free)
+        for day, free in available.items()
+    }
+
+
+async def compute_availability(days: List[str], service: str) -> Dict[str, int]:
+    """Free start masks of some days (in order), stored in the slot cache
+
+    One day is read with a single-day query, several with one range query.
+    """
+    versions = {day: slot_cache.version(day) for day in days}
+    if len(days) == 1:
+        days_booked = {days[0]: bookings_by_staff(await db.get_booked_intervals(days[0]))}
+    else:
+        days_booked = bookings_by_date(await db.get_booked_intervals_between(days[0], days[-1]))
+    duration = SERVICES[service].duration
+    available = {}
+    for day in days:
+        available[day] = roster.free_start_mask(days_booked.get(day, {}), service, duration)
+        slot_cache.put(day, service, available[day], versions[day])
+    return available
+
+
+warming = set()  # (date, service) pairs warm_availability() is computing
+
+
+async def warm_availability(days: List[str], service: str):
+    """Fill the slot cache for days the date picker showed without a count"""
+    days = [day for day in days if (day, service) not in warming]
+    if not days:
+        return
+    warming.update((day, service) for day in days)
+    try:
+        await compute_availability(days, service)
+    except Exception as e:
+        logger.warning(f"Warming availability for {service} failed: {e}")
+    finally:
+        warming.difference_update((day, service) for day in days)
+
+
+async def time_slot_keyboard(date_str: str, service: str) -> list:
+    """Buttons for every time some staff member is free for a service (cached per date and service)"""
+    available = slot_cache.get(date_str, service)
+    if available is None:
+        available = (await compute_availability([date_str], service))[date_str]
+    
+    keyboard = []
+    for minute in mask_minutes(upcoming(date_str, available)):
+        time_str = to_time_str(minute)
+        display_time = datetime.strptime(time_str, '%H:%M').strftime('%I:%M %p')
+        keyboard.append([InlineKeyboardButton(display_time, callback_data=f'time_{time_str}')])
+    
+    return keyboard
+
+
 async def date_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Date selected, show available times"""
     query = update.callback_query
@@ -202,27 +298,7 @@ async def date_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
     date_str = query.data.replace('date_', '')
     context.user_data['date'] = date_str
     
-    # Get available time slots
-    booked_slots = db.get_booked_slots(date_str)
-    duration = context.user_data['duration']
-    
-    keyboard = []
-    current_time = datetime.now()
-    selected_date = datetime.strptime(date_str, '%Y-%m-%d')
-    
-    for hour in range(BUSINESS_HOURS['start'], BUSINESS_HOURS['end']):
-        for minute in [0, 30]:
-            time_str = f"{hour:02d}:{minute:02d}"
-            slot_datetime = datetime.strptime(f"{date_str} {time_str}", '%Y-%m-%d %H:%M')
-            
-            # Skip past times for today
-            if selected_date.date() == current_time.date() and slot_datetime <= current_time:
-                continue
-            
-            # Check availability
-            if db.is_slot_available(date_str, time_str, duration, booked_slots):
-                display_time = slot_datetime.strftime('%I:%M %p')
-                keyboard.append([InlineKeyboardButton(display_time, callback_data=f'time_{time_str}')])
+    keyboard = await time_slot_keyboard(date_str, context.user_data['service'])
     
     if not keyboard:
         await query.edit_message_text(
@@ -260,14 +336,70 @@ async def time_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
     price = context.user_data['price']
     date = context.user_data['date']
     
-    # Save to database
+    # Save to database with the least busy staff member free then (fails
+    # cleanly if someone else just took the slot)
     user_id = query.from_user.id
-    appointment_id = db.create_appointment(user_id, service, date, time_str, name, phone)
+    booked = bookings_by_staff(await db.get_booked_intervals(date))
+    duration = context.user_data['duration']
+    staff_ids = roster.candidates(booked, service, duration, to_minutes(time_str))
+    reservation = await db.reserve_slot(user_id, service, date, time_str, name, phone, duration, staff_ids)
+    
+    if not reservation.ok:
+        # Another process may have cached the old grid; re-offer fresh slots
+        slot_cache.invalidate(date)
+        keyboard = await time_slot_keyboard(date, service)
+        
+        if not keyboard:
+            await query.edit_message_text(
+                "😔 Sorry, that time was just booked and no other slots are left on this date.\n\n"
+                "Please use /start to try another date."
+            )
+            return ConversationHandler.END
+        
+        await query.edit_message_text(
+            "😔 Sorry, that time was just booked by someone else.\n\n"
+            "🕐 *Please pick another time:*",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='Markdown'
+        )
+        return SELECT_TIME
+    
+    appointment_id = reservation.appointment_id
+    staff_name = roster.names[reservation.staff_id]
     
     # Format for display
     date_display = datetime.strptime(date, '%Y-%m-%d').strftime('%A, %B %d, %Y')
     time_display = datetime.strptime(time_str, '%H:%M').strftime('%I:%M %p')
     
+    # Queue the admin notification; the notifier sends it in the background
+    try:
+        await notifier.emit({
+            'id': appointment_id,
+            'name': name,
+            'phone': phone,
+            'service_name': service_name,
+            'staff_name': staff_name,
+            'date_display': date_display,
+            'time_display': time_display,
+            'price': price,
+        })
+    except Exception as e:
+        logger.error(f"Failed to queue admin notification: {e}")
+    
+    if REMINDER_HOURS > 0:
+        try:
+            await reminders.add({
+                'id': appointment_id,
+                'telegram_id': user_id,
+                'name': name,
+                'service': service,
+                'date': date,
+                'time': time_str,
+                'staff_id': reservation.staff_id,
+            })
+        except Exception as e:
+            logger.error(f"Failed to schedule reminder: {e}")  # the next rescan picks it up
+    
     # Show confirmation
     await query.edit_message_text(
         f"✅ *Booking Confirmed!*\n\n"
@@ -276,6 +408,7 @@ async def time_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"👤 Name: {name}\n"
         f"📱 Phone: {phone}\n"
         f"💇 Service: {service_name}\n"
+        f"💈 Barber: {staff_name}\n"
         f"💵 Price: ${price}\n"
         f"📅 Date: {date_display}\n"
         f"🕐 Time: {time_display}\n"
@@ -286,26 +419,6 @@ async def time_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode='Markdown'
     )
     
-    # Notify admin
-    try:
-        admin_message = (
-            f"🔔 *New Booking!*\n\n"
-            f"ID: #{appointment_id}\n"
-            f"Customer: {name}\n"
-            f"Phone: {phone}\n"
-            f"Service: {service_name}\n"
-            f"Date: {date_display}\n"
-            f"Time: {time_display}\n"
-            f"Price: ${price}"
-        )
-        await context.bot.send_message(
-            chat_id=ADMIN_TELEGRAM_ID,
-            text=admin_message,
-            parse_mode='Markdown'
-        )
-    except Exception as e:
-        logger.error(f"Failed to notify admin: {e}")
-    
     return ConversationHandler.END
 
 
@@ -318,30 +431,35 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ==================== My Bookings ====================
 
 async def show_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Show user's bookings"""
+    """Show a page of the user's bookings"""
     query = update.callback_query
     user_id = query.from_user.id
     
-    appointments = db.get_user_appointments(user_id)
+    # 'mybookings' opens the first page; Prev/Next send 'mybk_<p|n>_<date>_<time>_<id>'
+    after = before = None
+    if query.data.startswith('mybk_'):
+        await query.answer()
+        _, direction, date, time_str, apt_id = query.data.split('_')
+        key = (date, time_str, int(apt_id))
+        after, before = (key, None) if direction == 'n' else (None, key)
     
-    if not appointments:
-        keyboard = [[InlineKeyboardButton("⬅️ Back", callback_data='back')]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
+    page = await db.get_user_appointments_page(user_id, after, before, VIEW_PAGE_SIZE)
+    
+    if not page.rows:
         await query.edit_message_text(
             "📭 *No Bookings Found*\n\n"
             "You don't have any upcoming appointments.",
-            reply_markup=reply_markup,
+            reply_markup=BACK_KEYBOARD,
             parse_mode='Markdown'
         )
         return
     
     message = "📋 *Your Bookings*\n\n"
     
-    for apt in appointments:
+    for apt in page.rows:
         date_display = datetime.strptime(apt['date'], '%Y-%m-%d').strftime('%b %d, %Y')
         time_display = datetime.strptime(apt['time'], '%H:%M').strftime('%I:%M %p')
-        service_name = SERVICES.get(apt['service'], {}).get('name', apt['service'])
+        service_name = CATALOG.name_of(apt['service'])
         
         message += (
             f"🎫 ID: #{apt['id']}\n"
@@ -349,9 +467,12 @@ async def show_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"💇 {service_name}\n\n"
         )
     
-    keyboard = [[InlineKeyboardButton("⬅️ Back", callback_data='back')]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
+    first, last = page.rows[0], page.rows[-1]
+    reply_markup = pager_keyboard(
+        BACK_KEYBOARD,
+        prev_data=f"mybk_p_{first['date']}_{first['time']}_{first['id']}" if page.has_prev else None,
+        next_data=f"mybk_n_{last['date']}_{last['time']}_{last['id']}" if page.has_next else None
+    )
     await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='Markdown')
 
 
@@ -365,95 +486,92 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.answer("Unauthorized", show_alert=True)
         return
     
-    keyboard = [
-        [InlineKeyboardButton("📊 Today's Bookings", callback_data='admin_today')],
-        [InlineKeyboardButton("📅 Tomorrow's Bookings", callback_data='admin_tomorrow')],
-        [InlineKeyboardButton("📤 Forward All Bookings", callback_data='admin_forward')],
-        [InlineKeyboardButton("⬅️ Back", callback_data='back')]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await query.edit_message_text(
-        "⚙️ *Admin Panel*\n\nChoose an option:",
-        reply_markup=reply_markup,
+        ADMIN_PANEL_TEXT,
+        reply_markup=ADMIN_PANEL_KEYBOARD,
         parse_mode='Markdown'
     )
 
 
-async def admin_today(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Show today's bookings"""
-    query = update.callback_query
+async def show_day(query, date: str, after: tuple = None, before: tuple = None):
+    """Show a page of a date's bookings to the admin"""
+    today = datetime.now().date()
+    day = datetime.strptime(date, '%Y-%m-%d').date()
+    if day == today:
+        title, empty = "📊 *Today's Bookings*", "📭 *No Bookings Today*"
+    elif day == today + timedelta(days=1):
+        title, empty = "📅 *Tomorrow's Bookings*", "📭 *No Bookings Tomorrow*"
+    else:
+        day_display = day.strftime('%b %d, %Y')
+        title, empty = f"📅 *Bookings for {day_display}*", f"📭 *No Bookings on {day_display}*"
     
-    today = datetime.now().strftime('%Y-%m-%d')
-    appointments = db.get_appointments_by_date(today)
+    page = await db.get_appointments_by_date_page(date, after, before, VIEW_PAGE_SIZE)
     
-    if not appointments:
-        message = "📭 *No Bookings Today*"
-    else:
-        message = f"📊 *Today's Bookings* ({len(appointments)} total)\n\n"
-        
-        for apt in appointments:
-            time_display = datetime.strptime(apt['time'], '%H:%M').strftime('%I:%M %p')
-            service_name = SERVICES.get(apt['service'], {}).get('name', '')
-            
-            message += (
-                f"🕐 {time_display}\n"
-                f"👤 {apt['name']}\n"
-                f"📱 {apt['phone']}\n"
-                f"💇 {service_name}\n"
-                f"ID: #{apt['id']}\n\n"
-            )
+    if not page.rows:
+        await query.edit_message_text(empty, reply_markup=BACK_TO_ADMIN_KEYBOARD, parse_mode='Markdown')
+        return
     
-    keyboard = [[InlineKeyboardButton("⬅️ Back to Admin", callback_data='admin')]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    total = await db.count_appointments_by_date(date)
+    message = f"{title} ({total} total)\n\n"
     
+    for apt in page.rows:
+        time_display = datetime.strptime(apt['time'], '%H:%M').strftime('%I:%M %p')
+        service_name = CATALOG.name_of(apt['service'])
+        
+        message += (
+            f"🕐 {time_display}\n"
+            f"👤 {apt['name']}\n"
+            f"📱 {apt['phone']}\n"
+            f"💇 {service_name}\n"
+            f"💈 {roster.names.get(apt['staff_id'], 'Any available')}\n"
+            f"ID: #{apt['id']}\n\n"
+        )
+    
+    first, last = page.rows[0], page.rows[-1]
+    reply_markup = pager_keyboard(
+        BACK_TO_ADMIN_KEYBOARD,
+        prev_data=f"day_{date}_p_{first['start_min']}_{first['id']}" if page.has_prev else None,
+        next_data=f"day_{date}_n_{last['start_min']}_{last['id']}" if page.has_next else None
+    )
     await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='Markdown')
 
 
+async def admin_today(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show today's bookings"""
+    await show_day(update.callback_query, datetime.now().strftime('%Y-%m-%d'))
+
+
 async def admin_tomorrow(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show tomorrow's bookings"""
+    await show_day(update.callback_query, (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d'))
+
+
+async def admin_day_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Prev/Next in a day view: 'day_<date>_<p|n>_<start_min>_<id>'"""
     query = update.callback_query
     
-    tomorrow = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
-    appointments = db.get_appointments_by_date(tomorrow)
-    
-    if not appointments:
-        message = "📭 *No Bookings Tomorrow*"
-    else:
-        message = f"📅 *Tomorrow's Bookings* ({len(appointments)} total)\n\n"
-        
-        for apt in appointments:
-            time_display = datetime.strptime(apt['time'], '%H:%M').strftime('%I:%M %p')
-            service_name = SERVICES.get(apt['service'], {}).get('name', '')
-            
-            message += (
-                f"🕐 {time_display}\n"
-                f"👤 {apt['name']}\n"
-                f"📱 {apt['phone']}\n"
-                f"💇 {service_name}\n"
-                f"ID: #{apt['id']}\n\n"
-            )
-    
-    keyboard = [[InlineKeyboardButton("⬅️ Back to Admin", callback_data='admin')]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    if query.from_user.id != ADMIN_TELEGRAM_ID:
+        await query.answer("Unauthorized", show_alert=True)
+        return
+    await query.answer()
     
-    await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='Markdown')
+    _, date, direction, start_min, apt_id = query.data.split('_')
+    key = (int(start_min), int(apt_id))
+    after, before = (key, None) if direction == 'n' else (None, key)
+    await show_day(query, date, after, before)
 
 
 async def admin_forward(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Ask for Telegram contact to forward bookings"""
     query = update.callback_query
     
-    keyboard = [[InlineKeyboardButton("❌ Cancel", callback_data='admin')]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await query.edit_message_text(
         "📤 *Forward All Bookings*\n\n"
         "Please enter the *Telegram User ID* you want to forward bookings to.\n\n"
         "Example: 123456789\n\n"
         "(Get User ID from @userinfobot)\n\n"
         "Or click Cancel to go back.",
-        reply_markup=reply_markup,
+        reply_markup=CANCEL_TO_ADMIN_KEYBOARD,
         parse_mode='Markdown'
     )
     
@@ -470,69 +588,138 @@ async def handle_forward_id(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         target_id = int(update.message.text.strip())
-        context.user_data['awaiting_forward_id'] = False
-        
-        # Get all upcoming bookings
-        today = datetime.now().strftime('%Y-%m-%d')
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM appointments
-            WHERE date >= ? AND status = 'confirmed'
-            ORDER BY date, time
-        ''', (today,))
-        
-        appointments = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        if not appointments:
-            await update.message.reply_text("📭 No upcoming bookings to forward.")
-            return
-        
-        # Format all bookings
-        message = f"📋 *All Upcoming Bookings* ({len(appointments)} total)\n\n"
-        
-        for apt in appointments:
-            date_display = datetime.strptime(apt['date'], '%Y-%m-%d').strftime('%b %d, %Y')
-            time_display = datetime.strptime(apt['time'], '%H:%M').strftime('%I:%M %p')
-            service_name = SERVICES.get(apt['service'], {}).get('name', '')
-            
-            message += (
-                f"🎫 ID: #{apt['id']}\n"
-                f"📅 {date_display} at {time_display}\n"
-                f"👤 {apt['name']}\n"
-                f"📱 {apt['phone']}\n"
-                f"💇 {service_name}\n\n"
-            )
-        
-        # Forward to target user
-        await context.bot.send_message(
-            chat_id=target_id,
-            text=message,
-            parse_mode='Markdown'
+    except ValueError:
+        await update.message.reply_text(
+            "❌ Invalid User ID. Please enter numbers only.\n\n"
+            "Use /start to try again."
         )
+        return
+    
+    context.user_data['awaiting_forward_id'] = False
+    
+    total = await db.count_upcoming_appointments()
+    if not total:
+        await update.message.reply_text("📭 No upcoming bookings to forward.")
+        return
+    
+    status = await update.message.reply_text(f"📤 Forwarding {total} bookings to user ID: {target_id}...")
+    
+    # Big exports take a while; run in the background so the admin's chat stays responsive
+    context.application.create_task(forward_bookings(context.bot, target_id, total, status), update=update)
+
+
+def format_export_booking(apt: dict) -> str:
+    """One booking as a block of the forwarded export"""
+    date_display = datetime.strptime(apt['date'], '%Y-%m-%d').strftime('%b %d, %Y')
+    time_display = datetime.strptime(apt['time'], '%H:%M').strftime('%I:%M %p')
+    service_name = CATALOG.name_of(apt['service'])
+    
+    return (
+        f"🎫 ID: #{apt['id']}\n"
+        f"📅 {date_display} at {time_display}\n"
+        f"👤 {apt['name']}\n"
+        f"📱 {apt['phone']}\n"
+        f"💇 {service_name}\n\n"
+    )
+
+
+async def forward_bookings(bot, target_id: int, total: int, status):
+    """Stream upcoming bookings to target_id in message-sized chunks, reporting progress"""
+    packer = MessagePacker(f"📋 *All Upcoming Bookings* ({total} total)\n\n")
+    sent = 0
+    messages = 0
+    
+    # Background lane: the rate limiter paces these behind customer-facing calls
+    background = {'priority': BACKGROUND}
+    
+    async def send(chunks):
+        nonlocal sent, messages
+        for text, count in chunks:
+            await bot.send_message(chat_id=target_id, text=text, parse_mode='Markdown', rate_limit_args=background)
+            sent += count
+            messages += 1
+            await bot.edit_message_text(
+                f"📤 Forwarding to user ID: {target_id}...\n\nSent {sent} of {total} bookings",
+                chat_id=status.chat_id, message_id=status.message_id, rate_limit_args=background
+            )
+    
+    try:
+        # Rows are read a page at a time and sent as soon as a message fills up
+        async for apt in db.iter_upcoming_appointments():
+            await send(packer.add(format_export_booking(apt)))
+        await send(packer.flush())
         
-        await update.message.reply_text(
+        await status.edit_text(
             f"✅ *Forwarded Successfully!*\n\n"
-            f"Sent {len(appointments)} bookings to user ID: {target_id}\n\n"
+            f"Sent {sent} bookings in {messages} message(s) to user ID: {target_id}\n\n"
             f"Use /start to return to menu.",
             parse_mode='Markdown'
         )
         
-    except ValueError:
-        await update.message.reply_text(
-            "❌ Invalid User ID. Please enter numbers only.\n\n"
-            "Use /start to try again."
-        )
     except Exception as e:
         logger.error(f"Forward error: {e}")
-        await update.message.reply_text(
-            "❌ Failed to forward. Make sure the User ID is correct.\n\n"
+        await status.edit_text(
+            f"❌ Failed to forward after {sent} of {total} bookings. Make sure the User ID is correct.\n\n"
             "Use /start to try again."
         )
 
 
+def format_admin_notification(event: dict) -> str:
+    """One new booking as a block of an admin notification"""
+    return (
+        f"ID: #{event['id']}\n"
+        f"Customer: {event['name']}\n"
+        f"Phone: {event['phone']}\n"
+        f"Service: {event['service_name']}\n"
+        f"Barber: {event.get('staff_name', '')}\n"
+        f"Date: {event['date_display']}\n"
+        f"Time: {event['time_display']}\n"
+        f"Price: ${event['price']}\n\n"
+    )
+
+
+async def send_admin_notifications(events: List[dict]):
+    """Notify the admin of one new booking, or of several in a digest"""
+    header = "🔔 *New Booking!*\n\n" if len(events) == 1 else f"🔔 *{len(events)} New Bookings*\n\n"
+    packer = MessagePacker(header)
+    chunks = []
+    for event in events:
+        chunks += packer.add(format_admin_notification(event))
+    chunks += packer.flush()
+    
+    for text, _ in chunks:
+        await app_bot.bot.send_message(
+            chat_id=ADMIN_TELEGRAM_ID,
+            text=text.rstrip(),
+            parse_mode='Markdown',
+            rate_limit_args={'priority': BACKGROUND}
+        )
+
+
+async def send_reminder(reminder: dict):
+    """Remind a customer of their appointment"""
+    await bot_ready.wait()
+    service_name = CATALOG.name_of(reminder['service'])
+    date_display = datetime.strptime(reminder['date'], '%Y-%m-%d').strftime('%A, %B %d')
+    time_display = datetime.strptime(reminder['time'], '%H:%M').strftime('%I:%M %p')
+    await app_bot.bot.send_message(
+        chat_id=reminder['telegram_id'],
+        text=(
+            f"⏰ *Appointment Reminder*\n\n"
+            f"Hi {reminder['name']}, see you soon!\n\n"
+            f"🎫 Booking ID: *#{reminder['id']}*\n"
+            f"💇 Service: {service_name}\n"
+            f"💈 Barber: {roster.names.get(reminder['staff_id'], 'Any available')}\n"
+            f"📅 Date: {date_display}\n"
+            f"🕐 Time: {time_display}\n\n"
+            f"📍 Style Studio - 123 Main St\n\n"
+            f"Use /start to view or manage your bookings."
+        ),
+        parse_mode='Markdown',
+        rate_limit_args={'priority': BACKGROUND}
+    )
+
+
 # ==================== Error Handler ====================
 
 async def error_handler(update, context: ContextTypes.DEFAULT_TYPE):
@@ -542,7 +729,20 @@ async def error_handler(update, context: ContextTypes.DEFAULT_TYPE):
 
 # ==================== Build Telegram Application ====================
 
-app_bot = Application.builder().token(BOT_TOKEN).build()
+# Conversation state and user_data live in SQLite, shared by all workers
+persistence = SQLitePersistence(db, update_interval=PERSISTENCE_INTERVAL)
+
+# Every Bot API call goes through global and per-chat token buckets
+outbound = OutboundRateLimiter(overall_rate=OUTBOUND_RATE, chat_rate=OUTBOUND_CHAT_RATE)
+
+app_bot = (
+    Application.builder()
+    .token(BOT_TOKEN)
+    .base_url(f"{TELEGRAM_API_URL}/bot")
+    .persistence(persistence)
+    .rate_limiter(outbound)
+    .build()
+)
 
 # Conversation handler for booking flow
 conv_handler = ConversationHandler(
@@ -555,7 +755,10 @@ conv_handler = ConversationHandler(
         SELECT_TIME: [CallbackQueryHandler(time_selected, pattern='^time_')],
     },
     fallbacks=[CommandHandler('cancel', cancel)],
+    name='booking',
+    persistent=True,
 )
+persistence.track(conv_handler)
 
 # Add all handlers
 app_bot.add_handler(CommandHandler("start", start))
@@ -563,6 +766,8 @@ app_bot.add_handler(conv_handler)
 app_bot.add_handler(CallbackQueryHandler(button_handler, pattern='^(mybookings|admin|back)$'))
 app_bot.add_handler(CallbackQueryHandler(admin_today, pattern='^admin_today$'))
 app_bot.add_handler(CallbackQueryHandler(admin_tomorrow, pattern='^admin_tomorrow$'))
+app_bot.add_handler(CallbackQueryHandler(show_bookings, pattern='^mybk_'))
+app_bot.add_handler(CallbackQueryHandler(admin_day_page, pattern='^day_'))
 app_bot.add_handler(CallbackQueryHandler(admin_forward, pattern='^admin_forward$'))
 app_bot.add_handler(
     MessageHandler(
@@ -572,43 +777,218 @@ app_bot.add_handler(
 )
 app_bot.add_error_handler(error_handler)
 
+# Per-handler latency and the booking funnel, see /metrics
+instrument_handlers(app_bot, STATE_NAMES)
+
+
+# Opt-in slow-update logging and sampled flame-graph stacks; a no-op when both are off
+profiler = Profiler(sample_rate=PROFILE_SAMPLE_RATE, slow_ms=SLOW_UPDATE_MS, directory=PROFILE_DIR)
+
+
+# Set once the bot is initialized; with FAST_START that happens after the server is up
+bot_ready = asyncio.Event()
+
+
+async def process_update(update: Update):
+    """Pick up conversation states other workers wrote, dispatch, then write this update's changes
+
+    Waiting for PTB's update_interval would let another worker read state
+    up to that long stale. update_persistence() runs one at a time, so
+    updates finishing while a write is in flight share the next one.
+    """
+    if not bot_ready.is_set():
+        await bot_ready.wait()
+    with profiler.trace(update):
+        await persistence.refresh_conversations(update)
+        await app_bot.process_update(update)
+        try:
+            await app_bot.update_persistence()
+        except Exception as e:
+            # The changes stay buffered in the persistence for the next write
+            logger.warning(f"Persisting update {update.update_id} failed: {e}")
+
+
+# New-booking notifications leave the booking path; bursts become one digest
+notifier = AdminNotifier(
+    db, send_admin_notifications, threshold=ADMIN_DIGEST_THRESHOLD, window=ADMIN_DIGEST_WINDOW
+)
+
+# Past and cancelled appointments move to appointments_archive in the background
+archiver = Archiver(db, keep_days=ARCHIVE_KEEP_DAYS, interval=ARCHIVE_INTERVAL)
+
+# Reminders are sent from a heap of upcoming deadlines, see scheduler.py
+reminders = ReminderScheduler(db, send_reminder, remind_before=REMINDER_HOURS * 3600, batch_size=REMINDER_BATCH)
+
+# Webhook updates are queued and processed by workers, see telegram_webhook
+update_queue = UpdateQueue(process_update, maxsize=UPDATE_QUEUE_SIZE, workers=UPDATE_WORKERS)
+
+# Telegram redelivers updates we answer slowly; each update_id is processed once
+deduplicator = UpdateDeduplicator(
+    capacity=DEDUPE_CAPACITY,
+    shared=db.mark_update_seen if DEDUPE_SHARED else None,
+    forget_shared=db.forget_update if DEDUPE_SHARED else None
+)
+
 
 # ==================== FastAPI Setup ====================
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """Startup and shutdown events"""
-    # Startup: Initialize bot and set webhook
-    await app_bot.initialize()
-    await app_bot.start()
+async def ensure_webhook():
+    """Point Telegram at our webhook, unless it already is"""
     webhook_url = f"{WEBHOOK_URL}/webhook"
+    info = await app_bot.bot.get_webhook_info()
+    if info.url == webhook_url:
+        logger.info(f"✅ Webhook already set to {webhook_url}")
+        return
     await app_bot.bot.set_webhook(url=webhook_url)
     logger.info(f"✅ Webhook set to {webhook_url}")
+
+
+async def start_bot():
+    """Initialize the bot (getMe, persisted conversations) and start processing updates
+    
+    Safe to call again after a failure: initialize() does nothing once it
+    succeeded, and an application already running is not started twice.
+    """
+    await app_bot.initialize()
+    if not app_bot.running:
+        await app_bot.start()
+    bot_ready.set()
+
+
+async def _retry(step: Callable[[], Awaitable], what: str):
+    """Run a startup step until it succeeds, backing off up to a minute"""
+    delay = 1.0
+    while True:
+        try:
+            await step()
+            return
+        except Exception as e:
+            logger.error(f"{what} failed, retrying in {delay:.0f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+
+
+async def start_bot_in_background():
+    """FAST_START: bring the bot up while the server already queues updates
+    
+    The webhook is retried on its own once the bot runs, so a network
+    error talking to Telegram does not hold up queued updates.
+    """
+    await _retry(start_bot, "Bot startup")
+    await _retry(ensure_webhook, "Webhook registration")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup and shutdown events"""
+    # Startup: Initialize bot and set webhook. With FAST_START that runs in
+    # the background and updates wait in the queue until the bot is ready.
+    startup = None
+    if FAST_START:
+        startup = asyncio.create_task(start_bot_in_background(), name="bot-startup")
+    else:
+        await start_bot()
+        await ensure_webhook()
+    update_queue.start()
+    notifier.start()
+    profiler.start()
+    if ARCHIVE_INTERVAL > 0:
+        archiver.start()
+    if REMINDER_HOURS > 0:
+        reminders.start()
     
     yield
     
-    # Shutdown: Stop bot
-    await app_bot.stop()
+    # Shutdown: Finish queued updates, stop bot, release database connections
+    if startup is not None and not startup.done():
+        startup.cancel()
+        await asyncio.gather(startup, return_exceptions=True)
+    await archiver.stop()
+    await reminders.stop()
+    await update_queue.stop(timeout=SHUTDOWN_DRAIN_TIMEOUT)
+    await notifier.stop()
+    profiler.stop()
+    if app_bot.running:
+        await app_bot.stop()
     await app_bot.shutdown()
+    db.close()
 
 
 # Create FastAPI app
 app = FastAPI(lifespan=lifespan)
 
+WEBHOOK_REQUESTS = REGISTRY.counter(
+    'scheduler_webhook_requests_total', 'Webhook requests by outcome', ['outcome'])
+WEBHOOK_BYTES = REGISTRY.histogram(
+    'scheduler_webhook_request_bytes', 'Webhook request body sizes', buckets=SIZE_BUCKETS)
+
+# Gauges are read at scrape time only
+REGISTRY.gauge('scheduler_update_queue_depth', 'Updates waiting for a worker', lambda: update_queue.stats()['depth'])
+REGISTRY.gauge('scheduler_update_queue_active_chats', 'Chats with queued updates',
+               lambda: update_queue.stats()['active_chats'])
+REGISTRY.gauge('scheduler_outbound_queue_depth', 'Bot API calls waiting for the rate limiter',
+               lambda: outbound.stats()['depth'])
+REGISTRY.gauge('scheduler_admin_notifications_pending', 'Admin notifications not yet sent',
+               lambda: notifier.stats()['pending'])
+REGISTRY.gauge('scheduler_reminders_queued', 'Reminders loaded and waiting for their deadline',
+               lambda: reminders.stats()['queued'])
+REGISTRY.gauge('scheduler_slot_cache_entries', 'Cached availability grids', lambda: slot_cache.stats()['size'])
+
 
 @app.post("/webhook")
 async def telegram_webhook(request: Request):
-    """Handle incoming webhook updates from Telegram"""
+    """Queue incoming webhook updates from Telegram and acknowledge at once"""
+    received = time.perf_counter()
+    WEBHOOK_BYTES.observe(len(await request.body()))
     data = await request.json()
-    update = Update.de_json(data, app_bot.bot)
-    await app_bot.process_update(update)
+    update_id = data.get('update_id')
+    
+    if update_id is not None and await deduplicator.is_duplicate(update_id):
+        WEBHOOK_REQUESTS.inc('duplicate')
+        return {"ok": True}
+    
+    try:
+        update = Update.de_json(data, app_bot.bot)
+    except Exception:
+        if update_id is not None:
+            await deduplicator.forget(update_id)
+        raise
+    profiler.received(update, received)
+    
+    if not update_queue.submit(update):
+        # Queue full: let Telegram redeliver later instead of piling up
+        logger.warning(f"Update queue full, rejecting update {update_id}")
+        if update_id is not None:
+            await deduplicator.forget(update_id)
+        profiler.discard(update)
+        WEBHOOK_REQUESTS.inc('rejected')
+        return JSONResponse({"ok": False}, status_code=503)
+    
+    WEBHOOK_REQUESTS.inc('queued')
     return {"ok": True}
 
 
 @app.get("/")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "ok", "bot": "scheduler"}
+    return {
+        "status": "ok",
+        "bot": "scheduler",
+        "slot_cache": slot_cache.stats(),
+        "update_queue": update_queue.stats(),
+        "dedupe": deduplicator.stats(),
+        "outbound": outbound.stats(),
+        "admin_notifier": notifier.stats(),
+        "profiler": profiler.stats(),
+        "archiver": archiver.stats(),
+        "reminders": reminders.stats(),
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    return PlainTextResponse(REGISTRY.render(), media_type='text/plain; version=0.0.4')
 
 
 # ==================== Run Application ====================
@@ -616,4 +996,5 @@ async def health_check():
 if __name__ == "__main__":
     import uvicorn
     PORT = int(os.environ.get("PORT", 10000))
-    uvicorn.run("bot:app", host="0.0.0.0", port=PORT, log_level="info")
+    # Pass the app itself: "bot:app" would import this module a second time
+    uvicorn.run(app, host="0.0.0.0", port=PORT, log_level="info")
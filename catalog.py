@@ -0,0 +1,66 @@
+"""
+Service Catalog
+Services, opening hours and staff from config.py, checked and compiled once into read-only lookups
+"""
+
+from types import MappingProxyType
+from typing import Iterable, Mapping, NamedTuple
+
+import config
+from availability import MAX_DURATION, StaffRoster
+
+
+class Service(NamedTuple):
+    """One bookable service"""
+    key: str
+    name: str
+    duration: int  # minutes
+    price: int     # dollars
+
+
+class Catalog:
+    """Read-only services, opening hours and staff
+    
+    Built once at import from config.py; a mistake in the config (a bad
+    duration, staff offering an unknown service) fails startup instead of
+    the first booking. Bookings store their own duration and end time when
+    they are made, so editing the catalog only affects new bookings.
+    """
+    
+    __slots__ = ('services', 'open_minute', 'close_minute', 'closed_days', 'roster')
+    
+    def __init__(self, services: Mapping[str, dict], business_hours: Mapping[str, int],
+                 closed_days: Iterable[int], staff: Mapping[str, dict]):
+        compiled = {}
+        for key, info in services.items():
+            duration = int(info['duration'])
+            if not 0 < duration <= MAX_DURATION:
+                raise ValueError(f"Service {key!r}: duration must be 1 to {MAX_DURATION} minutes, not {duration}")
+            compiled[key] = Service(key, info['name'], duration, info['price'])
+        for staff_id, info in staff.items():
+            unknown = set(info.get('services', ())) - set(compiled)
+            if unknown:
+                raise ValueError(f"Staff {staff_id!r} offers unknown services: {', '.join(sorted(unknown))}")
+        
+        open_minute, close_minute = business_hours['start'] * 60, business_hours['end'] * 60
+        values = {
+            'services': MappingProxyType(compiled),
+            'open_minute': open_minute,
+            'close_minute': close_minute,
+            'closed_days': frozenset(closed_days),
+            'roster': StaffRoster(staff, compiled, open_minute, close_minute),
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("The catalog is read-only; edit config.py and restart")
+    
+    def name_of(self, key: str) -> str:
+        """Display name of a service, or its key if it was removed since it was booked"""
+        service = self.services.get(key)
+        return service.name if service is not None else key
+
+
+# The one catalog every module uses
+CATALOG = Catalog(config.SERVICES, config.BUSINESS_HOURS, config.CLOSED_DAYS, config.STAFF)
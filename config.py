@@ -54,6 +54,21 @@ SERVICES = {
 }
 
 
+# ===== STAFF =====
+# Each staff member has their own calendar; customers get whoever is free.
+# 'services' (default: all) limits what they are booked for, and 'hours'
+# overrides BUSINESS_HOURS for them.
+STAFF = {
+    'anthony': {'name': 'Anthony'},
+}
+
+# Example: a second barber who only does cuts and beards, afternoons
+#     'sam': {'name': 'Sam', 'services': ['haircut', 'beard'], 'hours': {'start': 12, 'end': 18}},
+
+# Services, hours and staff are read once at startup (see catalog.py);
+# existing bookings keep the duration they were booked with.
+
+
 # ===== EXAMPLE: HOW TO ADD MORE SERVICES =====
 # Uncomment and customize these to add more services:
 
@@ -3,71 +3,465 @@ Simple Database for MVP Scheduler Bot
 Handles all SQLite database operations
 """
 
+import asyncio
+import functools
 import sqlite3
-from datetime import datetime, timedelta
-from typing import List, Dict
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from time import perf_counter
+from typing import AsyncIterator, List, Dict, Optional, Sequence, Tuple
 import logging
 
+from availability import DEFAULT_DURATION, to_minutes
+from metrics import REGISTRY
+from profiling import current_trace
+
 logger = logging.getLogger(__name__)
 
+# Connection tuning (applied once per connection)
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KB = 8192
+STATEMENT_CACHE_SIZE = 128
+EXECUTOR_WORKERS = 4
+PAGE_SIZE = 200  # rows per keyset page when streaming large result sets
+
+# Telegram stops redelivering an update after 24 hours
+PROCESSED_UPDATE_RETENTION = 24 * 60 * 60  # seconds
+PROCESSED_UPDATE_PRUNE_EVERY = 1000  # inserts
+
+# Archival moves appointments out of the hot table in batches of this many rows
+ARCHIVE_BATCH_SIZE = 200
+ANALYSIS_LIMIT = 1000  # rows ANALYZE samples per index, so it stays cheap on a big archive
+
+# Durations migration 2 used to derive end_min for bookings made before it.
+# A frozen copy: new bookings store the duration they were made with.
+_MIGRATION_2_DURATIONS = {
+    'haircut': 30,
+    'beard': 20,
+    'color': 90,
+    'style': 45
+}
+
+
+# ==================== Schema Migrations ====================
+# Applied in order on startup. PRAGMA user_version holds the number of the
+# last applied migration, so append new ones and never edit old ones.
+
+def _migration_create_appointments(conn):
+    """Create appointments table"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS appointments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            service TEXT NOT NULL,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            status TEXT DEFAULT 'confirmed',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _migration_minute_columns_and_indexes(conn):
+    """Add start_min/end_min columns and range-query indexes"""
+    conn.execute('ALTER TABLE appointments ADD COLUMN start_min INTEGER')
+    conn.execute('ALTER TABLE appointments ADD COLUMN end_min INTEGER')
+    
+    rows = conn.execute('SELECT id, time, service FROM appointments').fetchall()
+    conn.executemany(
+        'UPDATE appointments SET start_min = ?, end_min = ? WHERE id = ?',
+        [
+            (to_minutes(row['time']),
+             to_minutes(row['time']) + _MIGRATION_2_DURATIONS.get(row['service'], DEFAULT_DURATION),
+             row['id'])
+            for row in rows
+        ]
+    )
+    
+    # Day views, booked slots and overlap checks
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_appointments_date_status_start
+        ON appointments (date, status, start_min)
+    ''')
+    # A customer's upcoming bookings
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_appointments_user_status_date
+        ON appointments (telegram_id, status, date, time)
+    ''')
+    # All upcoming bookings (admin export)
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_appointments_status_date
+        ON appointments (status, date, time)
+    ''')
+
+
+def _migration_processed_updates(conn):
+    """Create processed_updates table for webhook de-duplication"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS processed_updates (
+            update_id INTEGER PRIMARY KEY,
+            received_at INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_processed_updates_received
+        ON processed_updates (received_at)
+    ''')
+
+
+def _migration_persistence_tables(conn):
+    """Create tables for persisted user_data and conversation states"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS persisted_user_data (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            token TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS persisted_conversations (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            state TEXT NOT NULL,
+            token TEXT NOT NULL,
+            PRIMARY KEY (name, key)
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_persisted_conversations_user
+        ON persisted_conversations (user_id)
+    ''')
+
+
+def _migration_admin_events(conn):
+    """Create the outbox of admin notifications not yet sent"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS admin_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            payload TEXT NOT NULL,
+            owner TEXT NOT NULL,
+            claimed_at INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_admin_events_claimed_at
+        ON admin_events (claimed_at)
+    ''')
+
+
+def _migration_booked_intervals_index(conn):
+    """Add a covering index for booked intervals over a date range"""
+    # The week's availability is read from the index alone
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_appointments_status_date_span
+        ON appointments (status, date, start_min, end_min)
+    ''')
+
+
+# Columns shared by appointments and appointments_archive as of migration 7
+APPOINTMENT_COLUMNS = ('id, telegram_id, name, phone, service, date, time, status, created_at, '
+                       'start_min, end_min')
+
+
+def _migration_appointments_archive(conn):
+    """Create appointments_archive and the all_appointments view over both tables"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS appointments_archive (
+            id INTEGER PRIMARY KEY,
+            telegram_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            service TEXT NOT NULL,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            status TEXT,
+            created_at TIMESTAMP,
+            start_min INTEGER,
+            end_min INTEGER,
+            archived_at INTEGER NOT NULL
+        )
+    ''')
+    # A customer's history
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_appointments_archive_user_date
+        ON appointments_archive (telegram_id, date, time)
+    ''')
+    # A past day
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_appointments_archive_date
+        ON appointments_archive (date, start_min)
+    ''')
+    # Reads that must see archived rows too go through this view
+    conn.execute(f'''
+        CREATE VIEW IF NOT EXISTS all_appointments AS
+        SELECT {APPOINTMENT_COLUMNS}, 0 AS archived FROM appointments
+        UNION ALL
+        SELECT {APPOINTMENT_COLUMNS}, 1 AS archived FROM appointments_archive
+    ''')
+
+
+def _migration_reminder_state(conn):
+    """Add reminder claim/sent columns and an index of reminders still to send"""
+    conn.execute('ALTER TABLE appointments ADD COLUMN reminder_claimed_at INTEGER')
+    conn.execute('ALTER TABLE appointments ADD COLUMN reminder_sent_at INTEGER')
+    # Only rows still owed a reminder; they leave the index once it is sent
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_appointments_reminders_pending
+        ON appointments (date, time, id)
+        WHERE status = 'confirmed' AND reminder_sent_at IS NULL
+    ''')
+
+
+def _migration_staff(conn):
+    """Add staff_id to appointments and the archive, and to the booked-intervals index"""
+    conn.execute('ALTER TABLE appointments ADD COLUMN staff_id TEXT')
+    conn.execute('ALTER TABLE appointments_archive ADD COLUMN staff_id TEXT')
+    # Availability is computed per staff member, still from the index alone
+    conn.execute('DROP INDEX IF EXISTS idx_appointments_status_date_span')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_appointments_status_date_staff_span
+        ON appointments (status, date, staff_id, start_min, end_min)
+    ''')
+    _create_all_appointments_view(conn, f'{APPOINTMENT_COLUMNS}, staff_id')
+
+
+def _migration_appointment_duration(conn):
+    """Store each appointment's duration, to the archive too"""
+    for table in ('appointments', 'appointments_archive'):
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN duration INTEGER')
+        conn.execute(f'UPDATE {table} SET duration = end_min - start_min')
+    _create_all_appointments_view(conn, ARCHIVED_COLUMNS)
+
+
+def _create_all_appointments_view(conn, columns: str):
+    """(Re)create the view over appointments and the archive with these columns"""
+    conn.execute('DROP VIEW IF EXISTS all_appointments')
+    conn.execute(f'''
+        CREATE VIEW all_appointments AS
+        SELECT {columns}, 0 AS archived FROM appointments
+        UNION ALL
+        SELECT {columns}, 1 AS archived FROM appointments_archive
+    ''')
+
+
+# Columns appointments_archive shares with appointments now
+ARCHIVED_COLUMNS = f'{APPOINTMENT_COLUMNS}, staff_id, duration'
+
+
+MIGRATIONS = [
+    _migration_create_appointments,
+    _migration_minute_columns_and_indexes,
+    _migration_processed_updates,
+    _migration_persistence_tables,
+    _migration_admin_events,
+    _migration_booked_intervals_index,
+    _migration_appointments_archive,
+    _migration_reminder_state,
+    _migration_staff,
+    _migration_appointment_duration,
+]
+
+
+@dataclass
+class Reservation:
+    """Outcome of Database.reserve_slot"""
+    appointment_id: Optional[int] = None
+    conflict: Optional[Dict] = None  # the overlapping booking when the slot was taken
+    staff_id: Optional[str] = None  # who was booked, when staff were given
+    
+    @property
+    def ok(self) -> bool:
+        return self.appointment_id is not None
+
+
+@dataclass
+class Page:
+    """One page of a keyset-paginated listing"""
+    rows: List[Dict] = field(default_factory=list)
+    has_prev: bool = False
+    has_next: bool = False
+
 
 class Database:
-    def __init__(self, db_name='bookings.db'):
+    def __init__(self, db_name='bookings.db', lazy: bool = False):
+        """lazy: apply migrations on the first query instead of here"""
         self.db_name = db_name
-        self.init_database()
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._migrate_lock = threading.Lock()
+        self._migrated = False
+        self._change_listeners = []
+        if not lazy:
+            self.init_database()
     
-    def get_connection(self):
-        """Create database connection"""
-        conn = sqlite3.connect(self.db_name)
+    def _connect(self):
+        """Open a tuned connection"""
+        conn = sqlite3.connect(
+            self.db_name,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            isolation_level=None,  # transactions are explicit, see transaction()
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
         conn.row_factory = sqlite3.Row
+        # Only takes effect on a new file (before journal_mode) or at the next VACUUM, see compact()
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KB}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
         return conn
     
-    def init_database(self):
-        """Create tables if they don't exist"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def _thread_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+    
+    def get_connection(self):
+        """Return the calling thread's persistent connection"""
+        conn = self._thread_connection()
+        if not self._migrated:
+            self.init_database()
+        return conn
+    
+    @contextmanager
+    def transaction(self, immediate: bool = False, conn=None):
+        """Run a block in one transaction, rolling back on error"""
+        conn = conn or self.get_connection()
+        conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+    
+    def add_change_listener(self, callback):
+        """Call callback(date) after every committed write that touches a date"""
+        self._change_listeners.append(callback)
+    
+    def _notify_change(self, date: str):
+        for callback in self._change_listeners:
+            try:
+                callback(date)
+            except Exception as e:
+                logger.error(f"Change listener failed for {date}: {e}")
+    
+    def close(self):
+        """Close every pooled connection"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS appointments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                telegram_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                phone TEXT NOT NULL,
-                service TEXT NOT NULL,
-                date TEXT NOT NULL,
-                time TEXT NOT NULL,
-                status TEXT DEFAULT 'confirmed',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Error closing connection: {e}")
+        logger.info(f"Closed {len(connections)} database connection(s)")
+    
+    def init_database(self):
+        """Apply any pending schema migrations (once per instance)"""
+        with self._migrate_lock:
+            if self._migrated:
+                return
+            # IMMEDIATE takes the write lock first, so two processes starting
+            # together can't both apply the same migration
+            with self.transaction(immediate=True, conn=self._thread_connection()) as conn:
+                version = conn.execute('PRAGMA user_version').fetchone()[0]
+                for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                    migration(conn)
+                    conn.execute(f'PRAGMA user_version = {number}')
+                    logger.info(f"Applied migration {number}: {migration.__doc__}")
+            self._migrated = True
         
-        conn.commit()
-        conn.close()
         logger.info("Database initialized successfully")
     
-    def create_appointment(self, telegram_id: int, service: str, date: str, 
-                          time: str, name: str, phone: str) -> int:
-        """Create new appointment and return ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def _insert_appointment(self, conn, telegram_id: int, service: str, date: str, time: str,
+                            name: str, phone: str, duration: int, staff_id: Optional[str] = None) -> int:
+        start_min = to_minutes(time)
         
+        cursor = conn.execute('''
+            INSERT INTO appointments (telegram_id, name, phone, service, date, time,
+                                      start_min, end_min, duration, staff_id, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'confirmed')
+        ''', (telegram_id, name, phone, service, date, time, start_min, start_min + duration, duration, staff_id))
+        return cursor.lastrowid
+    
+    def create_appointment(self, telegram_id: int, service: str, date: str, time: str,
+                           name: str, phone: str, duration: int, staff_id: Optional[str] = None) -> int:
+        """Create new appointment of `duration` minutes and return ID"""
         try:
-            cursor.execute('''
-                INSERT INTO appointments (telegram_id, name, phone, service, date, time, status)
-                VALUES (?, ?, ?, ?, ?, ?, 'confirmed')
-            ''', (telegram_id, name, phone, service, date, time))
+            with self.transaction() as conn:
+                appointment_id = self._insert_appointment(conn, telegram_id, service, date, time, name, phone,
+                                                          duration, staff_id)
             
-            appointment_id = cursor.lastrowid
-            conn.commit()
+            self._notify_change(date)
             logger.info(f"Created appointment #{appointment_id} for user {telegram_id}")
             return appointment_id
             
         except Exception as e:
-            conn.rollback()
             logger.error(f"Error creating appointment: {e}")
             raise
-        finally:
-            conn.close()
+    
+    def reserve_slot(self, telegram_id: int, service: str, date: str, time: str, name: str, phone: str,
+                     duration: int, staff_ids: Optional[Sequence[str]] = None) -> Reservation:
+        """Book `duration` minutes from `time` only if nothing overlaps them, atomically
+        
+        With staff_ids, the first of them with nothing overlapping is booked
+        (bookings without a staff member overlap everyone). Without, any
+        overlapping booking takes the slot.
+        """
+        start_min = to_minutes(time)
+        end_min = start_min + duration
+        
+        try:
+            # IMMEDIATE takes the write lock before the overlap check, so no
+            # other writer can slip a booking in between check and insert
+            with self.transaction(immediate=True) as conn:
+                overlapping = conn.execute('''
+                    SELECT id, time, start_min, end_min, staff_id FROM appointments
+                    WHERE date = ? AND status = 'confirmed'
+                      AND start_min < ? AND end_min > ?
+                ''', (date, end_min, start_min)).fetchall()
+                
+                staff_id = None
+                if staff_ids is None:
+                    taken = bool(overlapping)
+                else:
+                    busy = {row['staff_id'] for row in overlapping}
+                    free = [] if None in busy else [candidate for candidate in staff_ids if candidate not in busy]
+                    staff_id = free[0] if free else None
+                    taken = staff_id is None
+                
+                if taken:
+                    conflict = dict(overlapping[0]) if overlapping else None
+                    logger.info(f"Slot {date} {time} for user {telegram_id} is taken")
+                    return Reservation(conflict=conflict)
+                
+                appointment_id = self._insert_appointment(conn, telegram_id, service, date, time, name, phone,
+                                                          duration, staff_id)
+            
+            self._notify_change(date)
+            logger.info(f"Reserved appointment #{appointment_id} for user {telegram_id}")
+            return Reservation(appointment_id=appointment_id, staff_id=staff_id)
+            
+        except Exception as e:
+            logger.error(f"Error reserving slot: {e}")
+            raise
     
     def get_user_appointments(self, telegram_id: int) -> List[Dict]:
         """Get all upcoming appointments for a user"""
@@ -83,7 +477,6 @@ class Database:
         ''', (telegram_id, today))
         
         appointments = [dict(row) for row in cursor.fetchall()]
-        conn.close()
         
         return appointments
     
@@ -95,50 +488,516 @@ class Database:
         cursor.execute('''
             SELECT * FROM appointments
             WHERE date = ? AND status = 'confirmed'
-            ORDER BY time
+            ORDER BY start_min
         ''', (date,))
         
         appointments = [dict(row) for row in cursor.fetchall()]
-        conn.close()
         
         return appointments
     
-    def get_booked_slots(self, date: str) -> List[tuple]:
-        """Get all booked time slots for a date"""
+    def get_upcoming_appointments(self) -> List[Dict]:
+        """Get all upcoming confirmed appointments"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
+        today = datetime.now().strftime('%Y-%m-%d')
+        
         cursor.execute('''
-            SELECT time, service FROM appointments
-            WHERE date = ? AND status = 'confirmed'
-        ''', (date,))
+            SELECT * FROM appointments
+            WHERE date >= ? AND status = 'confirmed'
+            ORDER BY date, time
+        ''', (today,))
         
-        slots = cursor.fetchall()
-        conn.close()
+        appointments = [dict(row) for row in cursor.fetchall()]
         
-        return [(row['time'], row['service']) for row in slots]
+        return appointments
     
-    def is_slot_available(self, date: str, time: str, duration: int, 
-                         booked_slots: List[tuple]) -> bool:
-        """Check if a time slot is available"""
-        slot_time = datetime.strptime(f"{date} {time}", '%Y-%m-%d %H:%M')
-        slot_end = slot_time + timedelta(minutes=duration)
+    def count_upcoming_appointments(self) -> int:
+        """Count all upcoming confirmed appointments"""
+        conn = self.get_connection()
+        today = datetime.now().strftime('%Y-%m-%d')
         
-        # Service durations
-        service_durations = {
-            'haircut': 30,
-            'beard': 20,
-            'color': 90,
-            'style': 45
-        }
+        row = conn.execute('''
+            SELECT COUNT(*) FROM appointments
+            WHERE date >= ? AND status = 'confirmed'
+        ''', (today,)).fetchone()
         
-        for booked_time_str, booked_service in booked_slots:
-            booked_time = datetime.strptime(f"{date} {booked_time_str}", '%Y-%m-%d %H:%M')
-            booked_duration = service_durations.get(booked_service, 30)
-            booked_end = booked_time + timedelta(minutes=booked_duration)
+        return row[0]
+    
+    def get_upcoming_page(self, after: Optional[tuple] = None, limit: int = PAGE_SIZE) -> List[Dict]:
+        """Get the next page of upcoming confirmed appointments after a (date, time, id) key"""
+        conn = self.get_connection()
+        after = after or (datetime.now().strftime('%Y-%m-%d'), '', 0)
+        
+        # The first key sorts before every booking of today, so it also
+        # serves as the date >= today filter
+        cursor = conn.execute('''
+            SELECT * FROM appointments
+            WHERE status = 'confirmed' AND (date, time, id) > (?, ?, ?)
+            ORDER BY date, time, id
+            LIMIT ?
+        ''', (*after, limit))
+        
+        return [dict(row) for row in cursor]
+    
+    def _keyset_page(self, where: str, params: tuple, key: Tuple[str, ...], after: Optional[tuple],
+                     before: Optional[tuple], limit: int, floor: Optional[tuple] = None) -> Page:
+        """A page of confirmed appointments matching `where`, ordered by the `key` columns
+        
+        Pass the key of the last row shown as `after` for the next page, or
+        of the first row shown as `before` for the previous one (neither: the
+        first page). Rows at or below `floor` are never listed. Reads at most
+        limit + 1 rows from an index on the `where` and `key` columns.
+        """
+        conn = self.get_connection()
+        columns = ', '.join(key)
+        marks = ', '.join('?' * len(key))
+        conditions = [where, "status = 'confirmed'"]
+        bounds = list(params)
+        if floor is not None:
+            conditions.append(f'({columns}) > ({marks})')
+            bounds += floor
+        
+        if before is not None:
+            conditions.append(f'({columns}) < ({marks})')
+            rows = conn.execute(f'''
+                SELECT * FROM appointments
+                WHERE {' AND '.join(conditions)}
+                ORDER BY {', '.join(f'{column} DESC' for column in key)}
+                LIMIT ?
+            ''', (*bounds, *before, limit + 1)).fetchall()
+            return Page([dict(row) for row in reversed(rows[:limit])], has_prev=len(rows) > limit, has_next=True)
+        
+        if after is not None:
+            conditions.append(f'({columns}) > ({marks})')
+            bounds += after
+        rows = conn.execute(f'''
+            SELECT * FROM appointments
+            WHERE {' AND '.join(conditions)}
+            ORDER BY {columns}
+            LIMIT ?
+        ''', (*bounds, limit + 1)).fetchall()
+        return Page([dict(row) for row in rows[:limit]], has_prev=after is not None, has_next=len(rows) > limit)
+    
+    def get_user_appointments_page(self, telegram_id: int, after: Optional[tuple] = None,
+                                   before: Optional[tuple] = None, limit: int = PAGE_SIZE) -> Page:
+        """A page of a user's upcoming appointments, keyed by (date, time, id)"""
+        today = (datetime.now().strftime('%Y-%m-%d'), '', 0)
+        return self._keyset_page('telegram_id = ?', (telegram_id,), ('date', 'time', 'id'),
+                                 after, before, limit, floor=today)
+    
+    def count_appointments_by_date(self, date: str) -> int:
+        """Count confirmed appointments on a date"""
+        conn = self.get_connection()
+        row = conn.execute(
+            "SELECT COUNT(*) FROM appointments WHERE date = ? AND status = 'confirmed'", (date,)
+        ).fetchone()
+        return row[0]
+    
+    def get_appointments_by_date_page(self, date: str, after: Optional[tuple] = None,
+                                      before: Optional[tuple] = None, limit: int = PAGE_SIZE) -> Page:
+        """A page of a date's appointments, keyed by (start_min, id)"""
+        return self._keyset_page('date = ?', (date,), ('start_min', 'id'), after, before, limit)
+    
+    def get_booked_intervals(self, date: str) -> List[tuple]:
+        """Get (staff_id, start_min, end_min) of every confirmed booking on a date"""
+        cursor = self.get_connection().cursor()
+        cursor.row_factory = None  # plain tuples: callers unpack every row
+        
+        return cursor.execute('''
+            SELECT staff_id, start_min, end_min FROM appointments
+            WHERE status = 'confirmed' AND date = ?
+        ''', (date,)).fetchall()
+    
+    def get_booked_intervals_between(self, first_date: str, last_date: str) -> List[tuple]:
+        """(date, staff_id, start_min, end_min) of every confirmed booking from first_date to last_date"""
+        cursor = self.get_connection().cursor()
+        cursor.row_factory = None  # plain tuples: callers unpack every row
+        
+        return cursor.execute('''
+            SELECT date, staff_id, start_min, end_min FROM appointments
+            WHERE status = 'confirmed' AND date BETWEEN ? AND ?
+        ''', (first_date, last_date)).fetchall()
+    
+    def has_overlap(self, date: str, start_min: int, end_min: int) -> bool:
+        """Check if any confirmed booking overlaps [start_min, end_min)"""
+        conn = self.get_connection()
+        
+        row = conn.execute('''
+            SELECT 1 FROM appointments
+            WHERE date = ? AND status = 'confirmed'
+              AND start_min < ? AND end_min > ?
+            LIMIT 1
+        ''', (date, end_min, start_min)).fetchone()
+        
+        return row is not None
+    
+    def mark_update_seen(self, update_id: int) -> bool:
+        """Record a webhook update_id; False if it was recorded before"""
+        now = int(datetime.now().timestamp())
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO processed_updates (update_id, received_at) VALUES (?, ?)',
+                (update_id, now)
+            )
+            if update_id % PROCESSED_UPDATE_PRUNE_EVERY == 0:
+                conn.execute('DELETE FROM processed_updates WHERE received_at < ?',
+                             (now - PROCESSED_UPDATE_RETENTION,))
+        return cursor.rowcount == 1
+    
+    def forget_update(self, update_id: int):
+        """Remove a recorded update_id so a redelivery is processed"""
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM processed_updates WHERE update_id = ?', (update_id,))
+    
+    def load_user_data(self, user_id: int) -> Optional[tuple]:
+        """Get (token, data) of a user's persisted user_data, if any"""
+        conn = self.get_connection()
+        row = conn.execute(
+            'SELECT token, data FROM persisted_user_data WHERE user_id = ?', (user_id,)
+        ).fetchone()
+        return (row['token'], row['data']) if row else None
+    
+    def load_conversations(self, name: str) -> List[tuple]:
+        """Get (key, state, token) of every persisted conversation of a handler"""
+        conn = self.get_connection()
+        rows = conn.execute(
+            'SELECT key, state, token FROM persisted_conversations WHERE name = ?', (name,)
+        ).fetchall()
+        return [(row['key'], row['state'], row['token']) for row in rows]
+    
+    def load_user_conversations(self, user_id: int) -> List[tuple]:
+        """Get (name, key, state, token) of a user's persisted conversations"""
+        conn = self.get_connection()
+        rows = conn.execute(
+            'SELECT name, key, state, token FROM persisted_conversations WHERE user_id = ?', (user_id,)
+        ).fetchall()
+        return [(row['name'], row['key'], row['state'], row['token']) for row in rows]
+    
+    def save_persisted_state(self, token: str, users: Dict[int, Optional[str]],
+                             conversations: Dict[tuple, tuple]):
+        """Write a batch of user_data and conversation changes in one transaction
+        
+        users maps user_id -> data (None drops it); conversations maps
+        (name, key) -> (user_id, state) (state None ends the conversation).
+        """
+        with self.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO persisted_user_data (user_id, data, token) VALUES (?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET data = excluded.data, token = excluded.token
+            ''', [(user_id, data, token) for user_id, data in users.items() if data is not None])
+            conn.executemany(
+                'DELETE FROM persisted_user_data WHERE user_id = ?',
+                [(user_id,) for user_id, data in users.items() if data is None]
+            )
+            conn.executemany('''
+                INSERT INTO persisted_conversations (name, key, user_id, state, token) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (name, key) DO UPDATE SET state = excluded.state, token = excluded.token
+            ''', [(name, key, user_id, state, token)
+                  for (name, key), (user_id, state) in conversations.items() if state is not None])
+            conn.executemany(
+                'DELETE FROM persisted_conversations WHERE name = ? AND key = ?',
+                [(name, key) for (name, key), (user_id, state) in conversations.items() if state is None]
+            )
+    
+    def add_admin_event(self, owner: str, payload: str) -> int:
+        """Store an admin notification claimed by `owner`; returns its ID"""
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                'INSERT INTO admin_events (payload, owner, claimed_at) VALUES (?, ?, ?)',
+                (payload, owner, int(datetime.now().timestamp()))
+            )
+        return cursor.lastrowid
+    
+    def claim_admin_events(self, owner: str, stale_before: int) -> List[tuple]:
+        """Take over events whose claim is older than stale_before; returns (id, payload)"""
+        with self.transaction(immediate=True) as conn:
+            rows = conn.execute(
+                'SELECT id, payload FROM admin_events WHERE claimed_at < ? ORDER BY id', (stale_before,)
+            ).fetchall()
+            conn.executemany(
+                'UPDATE admin_events SET owner = ?, claimed_at = ? WHERE id = ?',
+                [(owner, int(datetime.now().timestamp()), row['id']) for row in rows]
+            )
+        return [(row['id'], row['payload']) for row in rows]
+    
+    def delete_admin_events(self, event_ids: List[int]):
+        """Remove events that were sent"""
+        with self.transaction() as conn:
+            conn.executemany('DELETE FROM admin_events WHERE id = ?', [(event_id,) for event_id in event_ids])
+    
+    def get_pending_reminders(self, after: tuple, until: tuple, limit: int = PAGE_SIZE) -> List[Dict]:
+        """Confirmed appointments still owed a reminder, keyed (date, time, id) after `after`
+        
+        Only appointments starting at or before the (date, time) `until` are
+        returned. Reads the partial index of pending reminders.
+        """
+        conn = self.get_connection()
+        # The planner cannot tell that most rows in the window were already
+        # reminded and would pick idx_appointments_status_date
+        rows = conn.execute('''
+            SELECT id, telegram_id, name, service, date, time, staff_id
+            FROM appointments INDEXED BY idx_appointments_reminders_pending
+            WHERE status = 'confirmed' AND reminder_sent_at IS NULL
+              AND (date, time, id) > (?, ?, ?) AND (date, time) <= (?, ?)
+            ORDER BY date, time, id
+            LIMIT ?
+        ''', (*after, *until, limit)).fetchall()
+        return [dict(row) for row in rows]
+    
+    def claim_reminders(self, appointment_ids: List[int], stale_before: int) -> List[int]:
+        """Claim reminders still owed and not claimed since stale_before; returns the claimed IDs"""
+        if not appointment_ids:
+            return []
+        placeholders = ','.join('?' * len(appointment_ids))
+        with self.transaction(immediate=True) as conn:
+            claimed = [row['id'] for row in conn.execute(f'''
+                SELECT id FROM appointments
+                WHERE id IN ({placeholders}) AND status = 'confirmed' AND reminder_sent_at IS NULL
+                  AND (reminder_claimed_at IS NULL OR reminder_claimed_at < ?)
+            ''', (*appointment_ids, stale_before))]
+            conn.executemany(
+                'UPDATE appointments SET reminder_claimed_at = ? WHERE id = ?',
+                [(int(datetime.now().timestamp()), appointment_id) for appointment_id in claimed]
+            )
+        return claimed
+    
+    def mark_reminders_sent(self, appointment_ids: List[int]):
+        """Record reminders as sent (or not needed), so no process sends them again"""
+        with self.transaction() as conn:
+            conn.executemany(
+                'UPDATE appointments SET reminder_sent_at = ? WHERE id = ?',
+                [(int(datetime.now().timestamp()), appointment_id) for appointment_id in appointment_ids]
+            )
+    
+    def release_reminders(self, appointment_ids: List[int]):
+        """Drop the claim on reminders that failed to send, so they are retried"""
+        with self.transaction() as conn:
+            conn.executemany(
+                'UPDATE appointments SET reminder_claimed_at = NULL WHERE id = ?',
+                [(appointment_id,) for appointment_id in appointment_ids]
+            )
+    
+    def archive_appointments(self, before_date: str, limit: int = ARCHIVE_BATCH_SIZE) -> int:
+        """Move up to `limit` appointments dated before before_date, or cancelled, to the archive"""
+        with self.transaction(immediate=True) as conn:
+            ids = [row['id'] for row in conn.execute(
+                'SELECT id FROM appointments WHERE date < ? LIMIT ?', (before_date, limit)
+            )]
+            if len(ids) < limit:
+                ids += [row['id'] for row in conn.execute(
+                    "SELECT id FROM appointments WHERE status = 'cancelled' AND date >= ? LIMIT ?",
+                    (before_date, limit - len(ids))
+                )]
+            if not ids:
+                return 0
             
-            # Check for time overlap
-            if (slot_time < booked_end and slot_end > booked_time):
-                return False
+            placeholders = ','.join('?' * len(ids))
+            conn.execute(f'''
+                INSERT OR REPLACE INTO appointments_archive ({ARCHIVED_COLUMNS}, archived_at)
+                SELECT {ARCHIVED_COLUMNS}, ? FROM appointments WHERE id IN ({placeholders})
+            ''', (int(datetime.now().timestamp()), *ids))
+            conn.execute(f'DELETE FROM appointments WHERE id IN ({placeholders})', ids)
+        return len(ids)
+    
+    def compact(self, vacuum_pages: int) -> Dict[str, int]:
+        """Release up to vacuum_pages free pages to the OS and refresh planner statistics
         
-        return True
\ No newline at end of file
+        A file created before incremental auto-vacuum was enabled is converted
+        with one full VACUUM first.
+        """
+        conn = self.get_connection()
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            logger.info("Converting the database to incremental auto-vacuum (one-off VACUUM)")
+            conn.execute('VACUUM')
+        free_before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        conn.execute(f'PRAGMA incremental_vacuum({int(vacuum_pages)})').fetchall()  # runs as it is stepped
+        free_after = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+        conn.execute('ANALYZE')
+        return {'pages_released': free_before - free_after, 'pages_free': free_after}
+    
+    def count_archive(self) -> Dict[str, int]:
+        """Rows in the hot table and in the archive"""
+        conn = self.get_connection()
+        return {
+            'hot': conn.execute('SELECT COUNT(*) FROM appointments').fetchone()[0],
+            'archived': conn.execute('SELECT COUNT(*) FROM appointments_archive').fetchone()[0],
+        }
+    
+    def get_user_history(self, telegram_id: int, limit: int = PAGE_SIZE) -> List[Dict]:
+        """A customer's appointments of any date and status, archived ones included, newest first"""
+        conn = self.get_connection()
+        rows = conn.execute('''
+            SELECT * FROM all_appointments WHERE telegram_id = ?
+            ORDER BY date DESC, time DESC
+            LIMIT ?
+        ''', (telegram_id, limit)).fetchall()
+        return [dict(row) for row in rows]
+    
+    def get_history_by_date(self, date: str) -> List[Dict]:
+        """Every appointment of a date, archived ones included"""
+        conn = self.get_connection()
+        rows = conn.execute('''
+            SELECT * FROM all_appointments WHERE date = ? ORDER BY start_min, id
+        ''', (date,)).fetchall()
+        return [dict(row) for row in rows]
+
+
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    'scheduler_db_query_seconds', 'Time a Database call runs on its thread', ['query'])
+DB_WAIT_SECONDS = REGISTRY.histogram(
+    'scheduler_db_wait_seconds', 'Time a Database call waits for a free thread')
+DB_ERRORS = REGISTRY.counter(
+    'scheduler_db_errors_total', 'Database calls that raised', ['query'])
+
+
+def _timed_call(func, submitted: float, *args, **kwargs):
+    """Run func on a database thread, recording its wait and run time"""
+    start = perf_counter()
+    DB_WAIT_SECONDS.observe(start - submitted)
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        DB_ERRORS.inc(func.__name__)
+        raise
+    finally:
+        DB_QUERY_SECONDS.observe(perf_counter() - start, func.__name__)
+
+
+class AsyncDatabase:
+    """Awaitable Database wrapper that keeps SQLite off the event loop"""
+    
+    def __init__(self, database: Database, max_workers: int = EXECUTOR_WORKERS):
+        self.database = database
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db')
+    
+    async def _run(self, func, *args, **kwargs):
+        """Run a blocking Database call on the bounded executor"""
+        loop = asyncio.get_running_loop()
+        submitted = perf_counter()
+        trace = current_trace.get()
+        try:
+            return await loop.run_in_executor(
+                self._executor, functools.partial(_timed_call, func, submitted, *args, **kwargs)
+            )
+        finally:
+            if trace is not None:
+                trace.add_db(perf_counter() - submitted)
+    
+    async def create_appointment(self, telegram_id: int, service: str, date: str, time: str,
+                                 name: str, phone: str, duration: int, staff_id: Optional[str] = None) -> int:
+        return await self._run(self.database.create_appointment, telegram_id, service, date, time, name, phone,
+                               duration, staff_id)
+    
+    async def reserve_slot(self, telegram_id: int, service: str, date: str, time: str, name: str, phone: str,
+                           duration: int, staff_ids: Optional[Sequence[str]] = None) -> Reservation:
+        return await self._run(self.database.reserve_slot, telegram_id, service, date, time, name, phone,
+                               duration, staff_ids)
+    
+    async def get_user_appointments(self, telegram_id: int) -> List[Dict]:
+        return await self._run(self.database.get_user_appointments, telegram_id)
+    
+    async def get_appointments_by_date(self, date: str) -> List[Dict]:
+        return await self._run(self.database.get_appointments_by_date, date)
+    
+    async def get_upcoming_appointments(self) -> List[Dict]:
+        return await self._run(self.database.get_upcoming_appointments)
+    
+    async def count_upcoming_appointments(self) -> int:
+        return await self._run(self.database.count_upcoming_appointments)
+    
+    async def get_upcoming_page(self, after: Optional[tuple] = None, limit: int = PAGE_SIZE) -> List[Dict]:
+        return await self._run(self.database.get_upcoming_page, after, limit)
+    
+    async def iter_upcoming_appointments(self, page_size: int = PAGE_SIZE) -> AsyncIterator[Dict]:
+        """Stream upcoming appointments page by page, never holding them all"""
+        after = None
+        while True:
+            page = await self.get_upcoming_page(after, page_size)
+            for appointment in page:
+                yield appointment
+            if len(page) < page_size:
+                return
+            last = page[-1]
+            after = (last['date'], last['time'], last['id'])
+    
+    async def get_user_appointments_page(self, telegram_id: int, after: Optional[tuple] = None,
+                                         before: Optional[tuple] = None, limit: int = PAGE_SIZE) -> Page:
+        return await self._run(self.database.get_user_appointments_page, telegram_id, after, before, limit)
+    
+    async def count_appointments_by_date(self, date: str) -> int:
+        return await self._run(self.database.count_appointments_by_date, date)
+    
+    async def get_appointments_by_date_page(self, date: str, after: Optional[tuple] = None,
+                                            before: Optional[tuple] = None, limit: int = PAGE_SIZE) -> Page:
+        return await self._run(self.database.get_appointments_by_date_page, date, after, before, limit)
+    
+    async def get_booked_intervals(self, date: str) -> List[tuple]:
+        return await self._run(self.database.get_booked_intervals, date)
+    
+    async def get_booked_intervals_between(self, first_date: str, last_date: str) -> List[tuple]:
+        return await self._run(self.database.get_booked_intervals_between, first_date, last_date)
+    
+    async def has_overlap(self, date: str, start_min: int, end_min: int) -> bool:
+        return await self._run(self.database.has_overlap, date, start_min, end_min)
+    
+    async def mark_update_seen(self, update_id: int) -> bool:
+        return await self._run(self.database.mark_update_seen, update_id)
+    
+    async def forget_update(self, update_id: int):
+        return await self._run(self.database.forget_update, update_id)
+    
+    async def load_user_data(self, user_id: int) -> Optional[tuple]:
+        return await self._run(self.database.load_user_data, user_id)
+    
+    async def load_conversations(self, name: str) -> List[tuple]:
+        return await self._run(self.database.load_conversations, name)
+    
+    async def load_user_conversations(self, user_id: int) -> List[tuple]:
+        return await self._run(self.database.load_user_conversations, user_id)
+    
+    async def save_persisted_state(self, token: str, users: Dict[int, Optional[str]],
+                                   conversations: Dict[tuple, tuple]):
+        return await self._run(self.database.save_persisted_state, token, users, conversations)
+    
+    async def add_admin_event(self, owner: str, payload: str) -> int:
+        return await self._run(self.database.add_admin_event, owner, payload)
+    
+    async def claim_admin_events(self, owner: str, stale_before: int) -> List[tuple]:
+        return await self._run(self.database.claim_admin_events, owner, stale_before)
+    
+    async def delete_admin_events(self, event_ids: List[int]):
+        return await self._run(self.database.delete_admin_events, event_ids)
+    
+    async def get_pending_reminders(self, after: tuple, until: tuple, limit: int = PAGE_SIZE) -> List[Dict]:
+        return await self._run(self.database.get_pending_reminders, after, until, limit)
+    
+    async def claim_reminders(self, appointment_ids: List[int], stale_before: int) -> List[int]:
+        return await self._run(self.database.claim_reminders, appointment_ids, stale_before)
+    
+    async def mark_reminders_sent(self, appointment_ids: List[int]):
+        return await self._run(self.database.mark_reminders_sent, appointment_ids)
+    
+    async def release_reminders(self, appointment_ids: List[int]):
+        return await self._run(self.database.release_reminders, appointment_ids)
+    
+    async def archive_appointments(self, before_date: str, limit: int = ARCHIVE_BATCH_SIZE) -> int:
+        return await self._run(self.database.archive_appointments, before_date, limit)
+    
+    async def compact(self, vacuum_pages: int) -> Dict[str, int]:
+        return await self._run(self.database.compact, vacuum_pages)
+    
+    async def count_archive(self) -> Dict[str, int]:
+        return await self._run(self.database.count_archive)
+    
+    async def get_user_history(self, telegram_id: int, limit: int = PAGE_SIZE) -> List[Dict]:
+        return await self._run(self.database.get_user_history, telegram_id, limit)
+    
+    async def get_history_by_date(self, date: str) -> List[Dict]:
+        return await self._run(self.database.get_history_by_date, date)
+    
+    def close(self):
+        """Wait for in-flight queries, then close the connection pool"""
+        self._executor.shutdown(wait=True)
+        self.database.close()
@@ -0,0 +1,219 @@
+"""
+Metrics
+Counters and histograms rendered in the Prometheus text format at /metrics
+"""
+
+import functools
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Seconds; covers a cached lookup (sub-millisecond) up to a slow Bot API call
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 65536)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base for sharded metrics
+
+    Every thread updates its own shard, so recording never takes a lock and
+    never races: the event loop and each database thread own one shard. A
+    scrape adds the shards up.
+    """
+
+    kind = ''
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._shards = {}  # thread ident -> {label values: cells}
+
+    def _shard(self) -> dict:
+        ident = threading.get_ident()
+        shard = self._shards.get(ident)
+        if shard is None:
+            shard = self._shards[ident] = {}
+        return shard
+
+    def _merged(self) -> Dict[tuple, list]:
+        merged = {}
+        for shard in list(self._shards.values()):
+            for labels, cells in list(shard.items()):
+                total = merged.get(labels)
+                if total is None:
+                    merged[labels] = list(cells)
+                else:
+                    for i, cell in enumerate(cells):
+                        total[i] += cell
+        return merged
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    """Monotonic count, optionally per label values"""
+
+    kind = 'counter'
+
+    def inc(self, *labels, amount: float = 1):
+        shard = self._shard()
+        cells = shard.get(labels)
+        if cells is None:
+            cells = shard[labels] = [0]
+        cells[0] += amount
+
+    def value(self, *labels) -> float:
+        cells = self._merged().get(labels)
+        return cells[0] if cells else 0
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, cells in sorted(self._merged().items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {_format(cells[0])}')
+        return lines
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        shard = self._shard()
+        cells = shard.get(labels)
+        if cells is None:
+            # One count per bucket, one for +Inf, then the sum
+            cells = shard[labels] = [0] * (len(self.buckets) + 2)
+        cells[bisect_left(self.buckets, value)] += 1
+        cells[-1] += value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, cells in sorted(self._merged().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), cells):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_format(float(cells[-1]))}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+class Gauge(_Metric):
+    """Value read from a callback at scrape time, so it costs nothing in between"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        super().__init__(name, help)
+        self.read = read
+
+    def render(self) -> List[str]:
+        return super().render() + [f'{self.name} {_format(self.read())}']
+
+
+class Registry:
+    """All metrics of the process, by name"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _get_or_add(self, cls, name: str, *args, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, *args, **kwargs)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._get_or_add(Counter, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_add(Histogram, name, help, labelnames, buckets)
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) -> Gauge:
+        metric = self._get_or_add(Gauge, name, help, read)
+        metric.read = read
+        return metric
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.histogram(
+    'scheduler_handler_seconds', 'Time spent in each update handler', ['handler'])
+HANDLER_ERRORS = REGISTRY.counter(
+    'scheduler_handler_errors_total', 'Update handlers that raised', ['handler'])
+CONVERSATION_STEPS = REGISTRY.counter(
+    'scheduler_conversation_steps_total', 'Conversation handler results by the state they moved to',
+    ['conversation', 'state'])
+
+
+def _timed_callback(callback, name: str, conversation: Optional[str] = None,
+                    state_names: Optional[Dict[object, str]] = None):
+    @functools.wraps(callback)
+    async def timed(update, context):
+        start = time.perf_counter()
+        try:
+            result = await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, name)
+        if conversation is not None and result is not None:
+            CONVERSATION_STEPS.inc(conversation, state_names.get(result, str(result)))
+        return result
+    return timed
+
+
+def instrument_handlers(application, state_names: Optional[Dict[object, str]] = None):
+    """Time every handler callback registered on a PTB Application
+
+    Callbacks inside a ConversationHandler also count the state they
+    return, which gives a funnel of how far conversations get.
+    """
+    from telegram.ext import ConversationHandler
+
+    state_names = {ConversationHandler.END: 'end', **(state_names or {})}
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, ConversationHandler):
+                inner = list(handler.entry_points) + list(handler.fallbacks)
+                for state_handlers in handler.states.values():
+                    inner.extend(state_handlers)
+                for step in inner:
+                    step.callback = _timed_callback(step.callback, step.callback.__name__,
+                                                    handler.name or 'conversation', state_names)
+            else:
+                handler.callback = _timed_callback(handler.callback, handler.callback.__name__)
@@ -0,0 +1,156 @@
+"""
+Admin Notifications
+Sends new-booking notifications from a background task, folding bursts into digests
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from database import AsyncDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class AdminNotifier:
+    """Outbox for admin notifications
+
+    emit() stores the event in the admin_events table and returns at once.
+    A background task sends pending events through `send` (which gets a
+    list of payloads) as soon as `threshold` of them are waiting or the
+    oldest has waited `window` seconds, so a burst becomes one digest.
+    Sent events are deleted. Events another process stored but did not
+    send within `recover_after` seconds (it crashed or was restarted) are
+    claimed and sent here; delivery is at least once.
+    """
+
+    def __init__(self, db: AsyncDatabase, send: Callable[[List[dict]], Awaitable],
+                 threshold: int = 5, window: float = 10.0, recover_after: float = 60.0):
+        self.db = db
+        self._send = send
+        self.threshold = threshold
+        self.window = window
+        self.recover_after = recover_after
+        self._owner = uuid.uuid4().hex[:12]
+        self._pending = []  # (event_id, payload, emitted_at)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        # Metrics
+        self.emitted = 0
+        self.recovered = 0
+        self.sent = 0
+        self.batches = 0
+        self.failed = 0
+
+    def start(self):
+        """Spawn the sender task"""
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run(), name="admin-notifier")
+
+    async def emit(self, payload: dict):
+        """Queue a notification; it is stored before this returns"""
+        event_id = await self.db.add_admin_event(self._owner, json.dumps(payload))
+        self._pending.append((event_id, payload, time.monotonic()))
+        self.emitted += 1
+        if len(self._pending) == 1 or len(self._pending) >= self.threshold:
+            self._wakeup.set()
+
+    async def _run(self):
+        next_recovery = 0.0
+        while not self._stopping:
+            if time.monotonic() >= next_recovery:
+                await self._recover()
+                next_recovery = time.monotonic() + self.recover_after / 2
+
+            if self._pending:
+                # The window runs from the oldest waiting event
+                timeout = self._pending[0][2] + self.window - time.monotonic()
+                if len(self._pending) < self.threshold and timeout > 0:
+                    await self._wait(timeout)
+                    continue
+                if not await self._flush():
+                    await self._wait(self.window)  # Telegram unreachable: back off
+            else:
+                await self._wait(next_recovery - time.monotonic())
+
+    async def _wait(self, timeout: float):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), max(timeout, 0))
+        except asyncio.TimeoutError:
+            pass
+
+    async def _recover(self):
+        """Claim events left behind by a process that never sent them"""
+        stale_before = int(datetime.now().timestamp() - self.recover_after)
+        try:
+            rows = await self.db.claim_admin_events(self._owner, stale_before)
+        except Exception as e:
+            logger.error(f"Failed to recover admin notifications: {e}")
+            return
+        held = {event_id for event_id, _, _ in self._pending}
+        rows = [(event_id, payload) for event_id, payload in rows if event_id not in held]
+        if rows:
+            logger.info(f"Recovered {len(rows)} unsent admin notification(s)")
+            self.recovered += len(rows)
+            now = time.monotonic()
+            self._pending = [(event_id, json.loads(payload), now - self.window)
+                             for event_id, payload in rows] + self._pending
+
+    async def _flush(self) -> bool:
+        """Send everything pending as one batch; False if sending failed"""
+        batch, self._pending = self._pending, []
+        try:
+            await self._send([payload for _, payload, _ in batch])
+        except Exception as e:
+            logger.error(f"Failed to notify admin: {e}")
+            self.failed += 1
+            self._pending = batch + self._pending
+            return False
+
+        self.sent += len(batch)
+        self.batches += 1
+        try:
+            await self.db.delete_admin_events([event_id for event_id, _, _ in batch])
+        except Exception as e:
+            logger.error(f"Failed to clear sent admin notifications: {e}")
+        return True
+
+    async def stop(self, timeout: float = 10.0):
+        """Let the batch being sent finish, stop the sender task, then send whatever is pending
+
+        A batch still unfinished after `timeout` is cancelled; its events
+        stay stored and are sent after a restart through recovery.
+        """
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        except Exception as e:
+            logger.error(f"Admin notifier stopped with an error: {e}")
+        self._task = None
+        if self._pending:
+            await self._flush()  # unsent events stay stored for recovery
+
+    def stats(self) -> Dict[str, int]:
+        """Event and batch counters"""
+        return {
+            'pending': len(self._pending),
+            'emitted': self.emitted,
+            'recovered': self.recovered,
+            'sent': self.sent,
+            'batches': self.batches,
+            'failed': self.failed,
+        }
@@ -0,0 +1,248 @@
+"""
+Outbound Rate Limiter
+Paces every Bot API call through global and per-chat token buckets
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import REGISTRY
+from profiling import current_trace
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes, served in this order
+USER = 0        # answers and edits a customer is waiting on
+NORMAL = 1      # other sends
+BACKGROUND = 2  # admin notifications, exports
+
+LANE_NAMES = {USER: 'user', NORMAL: 'normal', BACKGROUND: 'background'}
+
+USER_ENDPOINTS = {'answerCallbackQuery', 'editMessageText', 'editMessageReplyMarkup'}
+
+CHAT_BUCKETS_MAX = 10000  # idle, full buckets are dropped beyond this many
+
+API_SECONDS = REGISTRY.histogram(
+    'scheduler_telegram_api_seconds', 'Bot API call latency, excluding rate-limit waits', ['endpoint'])
+API_ERRORS = REGISTRY.counter(
+    'scheduler_telegram_api_errors_total', 'Bot API calls that raised', ['endpoint', 'error'])
+API_WAIT_SECONDS = REGISTRY.histogram(
+    'scheduler_telegram_api_wait_seconds', 'Time Bot API calls waited for the rate limiter', ['lane'])
+
+
+class TokenBucket:
+    """Allows `rate` calls per second with bursts of up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is available now)"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class OutboundRateLimiter(BaseRateLimiter[Dict[str, Any]]):
+    """Rate limiter for ExtBot: token buckets, priority lanes, RetryAfter backoff
+
+    Requests wait in one FIFO lane per priority. A single dispatcher grants
+    them in lane order, skipping chats whose bucket is empty so one busy
+    chat does not hold up the others; requests to the same chat keep their
+    order. A RetryAfter from Telegram pauses all sending for the time it
+    asks for, then the request is retried at the head of its lane.
+
+    The lane defaults to USER for answers and edits and NORMAL otherwise;
+    override it per call with rate_limit_args={'priority': BACKGROUND}.
+    """
+
+    def __init__(self, overall_rate: float = 30.0, overall_burst: float = 30.0,
+                 chat_rate: float = 1.0, chat_burst: float = 3.0,
+                 group_rate: float = 20 / 60, group_burst: float = 5.0,
+                 max_retries: int = 3):
+        self.overall = TokenBucket(overall_rate, overall_burst)
+        self.chat_limits = (chat_rate, chat_burst)
+        self.group_limits = (group_rate, group_burst)
+        self.max_retries = max_retries
+        self._chats = {}  # chat_id -> TokenBucket
+        self._lanes = {priority: deque() for priority in LANE_NAMES}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._paused_until = 0.0
+
+        # Metrics
+        self.granted = 0
+        self.sent = 0
+        self.retries = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    async def initialize(self):
+        self._start()
+
+    def _start(self):
+        if self._dispatcher is None:
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch(), name="outbound-dispatcher")
+
+    async def shutdown(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+        for lane in self._lanes.values():
+            while lane:
+                _, _, granted = lane.popleft()
+                granted.cancel()
+
+    async def process_request(self, callback: Callable, args: Any, kwargs: Dict[str, Any],
+                              endpoint: str, data: Dict[str, Any],
+                              rate_limit_args: Optional[Dict[str, Any]]):
+        priority = (rate_limit_args or {}).get('priority', USER if endpoint in USER_ENDPOINTS else NORMAL)
+        chat_id = data.get('chat_id')
+
+        trace = current_trace.get()
+        begun = time.monotonic()
+        try:
+            for attempt in range(self.max_retries + 1):
+                await self._acquire(priority, chat_id, retry=attempt > 0)
+                started = time.monotonic()
+                try:
+                    result = await callback(*args, **kwargs)
+                except Exception as e:
+                    API_SECONDS.observe(time.monotonic() - started, endpoint)
+                    API_ERRORS.inc(endpoint, type(e).__name__)
+                    if not isinstance(e, RetryAfter):
+                        raise
+                    self._paused_until = max(self._paused_until, time.monotonic() + float(e.retry_after))
+                    if attempt == self.max_retries:
+                        self.failed += 1
+                        raise
+                    self.retries += 1
+                    logger.warning(f"{endpoint} hit a flood limit, retrying in {e.retry_after}s")
+                    continue
+
+                latency = time.monotonic() - started
+                API_SECONDS.observe(latency, endpoint)
+                self.sent += 1
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+                return result
+        finally:
+            if trace is not None:
+                trace.add_outbound(time.monotonic() - begun)
+
+    async def _acquire(self, priority: int, chat_id, retry: bool = False):
+        """Wait until the dispatcher grants this request a send slot"""
+        self._start()
+        granted = asyncio.get_running_loop().create_future()
+        queued_at = time.monotonic()
+        entry = (queued_at, chat_id, granted)
+        if retry:
+            self._lanes[priority].appendleft(entry)  # keep its place ahead of later sends
+        else:
+            self._lanes[priority].append(entry)
+        self._wakeup.set()
+        await granted
+        API_WAIT_SECONDS.observe(time.monotonic() - queued_at, LANE_NAMES[priority])
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Group and channel ids are negative (or @usernames)
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            bucket = self._chats[chat_id] = TokenBucket(*(self.group_limits if is_group else self.chat_limits))
+            if len(self._chats) > CHAT_BUCKETS_MAX:
+                self._prune_chats()
+        return bucket
+
+    def _prune_chats(self):
+        """Forget chats whose bucket has refilled; a new bucket starts full anyway"""
+        now = time.monotonic()
+        for chat_id in [chat_id for chat_id, bucket in self._chats.items() if bucket.delay(now) == 0
+                        and bucket.tokens >= bucket.capacity]:
+            del self._chats[chat_id]
+
+    def _next_ready(self, now: float):
+        """Pop the first grantable request in lane order
+
+        Returns the request, or None and how long until a chat bucket refills
+        (None: nothing is queued).
+        """
+        wait = None
+        for lane in self._lanes.values():
+            for cancelled in [entry for entry in lane if entry[2].cancelled()]:
+                lane.remove(cancelled)
+            blocked = set()
+            for index, (queued_at, chat_id, granted) in enumerate(lane):
+                if chat_id in blocked:
+                    continue
+                delay = 0.0 if chat_id is None else self._chat_bucket(chat_id).delay(now)
+                if delay == 0:
+                    del lane[index]
+                    return (queued_at, chat_id, granted), None
+                blocked.add(chat_id)
+                wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    async def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            delay = max(self._paused_until - now, self.overall.delay(now))
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            entry, wait = self._next_ready(now)
+            if entry is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            queued_at, chat_id, granted = entry
+            self.overall.take(now)
+            if chat_id is not None:
+                self._chat_bucket(chat_id).take(now)
+
+            wait = now - queued_at
+            self.granted += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            granted.set_result(None)
+
+    def stats(self) -> Dict[str, float]:
+        """Queue depths, send counters and wait/latency times"""
+        return {
+            'depth': sum(len(lane) for lane in self._lanes.values()),
+            **{f'depth_{name}': len(self._lanes[priority]) for priority, name in LANE_NAMES.items()},
+            'sent': self.sent,
+            'retries': self.retries,
+            'failed': self.failed,
+            'chats': len(self._chats),
+            'wait_avg_ms': round(self.wait_total / self.granted * 1000, 2) if self.granted else 0.0,
+            'wait_max_ms': round(self.wait_max * 1000, 2),
+            'latency_avg_ms': round(self.latency_total / self.sent * 1000, 2) if self.sent else 0.0,
+            'latency_max_ms': round(self.latency_max * 1000, 2),
+        }
@@ -0,0 +1,205 @@
+"""
+SQLite Persistence
+Stores conversation states and user_data in bookings.db so any worker process
+(or a restarted one) can continue a customer's booking
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import uuid
+from typing import Dict, Optional
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from database import AsyncDatabase
+
+logger = logging.getLogger(__name__)
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, separators=(',', ':'))
+
+
+class SQLitePersistence(BasePersistence):
+    """BasePersistence backed by the bookings database
+
+    - user_data is loaded lazily, one user at a time, in refresh_user_data.
+    - Writes are buffered; all changes PTB hands over in one
+      update_persistence() run are written in a single transaction. bot.py
+      runs it after every update, besides PTB's own update_interval runs.
+    - Every written row carries this process's token. A row whose token is
+      not the one we last wrote or read was changed by another process and
+      is reloaded; otherwise our in-memory copy is at least as new.
+
+    PTB reads ConversationHandler states only at startup, so call
+    refresh_conversations(update) before process_update to pick up states
+    written by other processes.
+    """
+
+    def __init__(self, db: AsyncDatabase, update_interval: float = 2.0):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.db = db
+        self._instance = uuid.uuid4().hex[:12]
+        self._counter = itertools.count()
+        self._user_tokens = {}          # user_id -> token of the version we hold
+        self._conversation_tokens = {}  # (name, key) -> token of the state we hold
+        self._user_conversations = {}   # user_id -> {(name, key)} with a held token
+        self._handlers = []
+        self._pending_users = {}
+        self._pending_conversations = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_taken = False
+
+    # ---------- Loading ----------
+
+    async def get_user_data(self) -> Dict[int, dict]:
+        return {}  # loaded per user in refresh_user_data
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        conversations = {}
+        for key, state, token in await self.db.load_conversations(name):
+            conversations[tuple(json.loads(key))] = json.loads(state)
+            self._remember_conversation((name, key), json.loads(key)[-1], token)
+        logger.info(f"Restored {len(conversations)} '{name}' conversation(s)")
+        return conversations
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        row = await self.db.load_user_data(user_id)
+        if row is None or row[0] == self._user_tokens.get(user_id):
+            return
+        token, data = row
+        user_data.clear()
+        user_data.update(json.loads(data))
+        self._user_tokens[user_id] = token
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict):
+        pass
+
+    def track(self, handler):
+        """Register a persistent ConversationHandler for refresh_conversations"""
+        self._handlers.append(handler)
+
+    async def refresh_conversations(self, update):
+        """Load conversation states other processes wrote for this update's user"""
+        if update.effective_user is None or not self._handlers:
+            return
+        user_id = update.effective_user.id
+
+        stored = {}
+        for name, key, state, token in await self.db.load_user_conversations(user_id):
+            stored[(name, key)] = (state, token)
+
+        for handler in self._handlers:
+            # ConversationHandler keeps its states in a private TrackingDict;
+            # writing to .data changes a state without scheduling a write-back
+            states = handler._conversations.data
+            held = {name_key for name_key in self._user_conversations.get(user_id, ()) if name_key[0] == handler.name}
+            for name_key in held | {name_key for name_key in stored if name_key[0] == handler.name}:
+                key = tuple(json.loads(name_key[1]))
+                if name_key in stored:
+                    state, token = stored[name_key]
+                    if token != self._conversation_tokens.get(name_key):
+                        states[key] = json.loads(state)
+                        self._remember_conversation(name_key, user_id, token)
+                else:
+                    # Ended by another process
+                    states.pop(key, None)
+                    self._remember_conversation(name_key, user_id, None)
+
+    def _remember_conversation(self, name_key: tuple, user_id: int, token: Optional[str]):
+        """Track the token of a conversation state we hold (None: we hold none)"""
+        keys = self._user_conversations.setdefault(user_id, set())
+        if token is None:
+            self._conversation_tokens.pop(name_key, None)
+            keys.discard(name_key)
+            if not keys:
+                del self._user_conversations[user_id]
+        else:
+            self._conversation_tokens[name_key] = token
+            keys.add(name_key)
+
+    # ---------- Buffered writes ----------
+
+    async def update_user_data(self, user_id: int, data: dict):
+        self._pending_users[user_id] = _dumps(data)
+        await self._flush_soon()
+
+    async def drop_user_data(self, user_id: int):
+        self._pending_users[user_id] = None
+        await self._flush_soon()
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]):
+        # Conversation keys are (chat_id, user_id) with the default per_user=True
+        state = None if new_state is None else _dumps(new_state)
+        self._pending_conversations[(name, _dumps(list(key)))] = (key[-1], state)
+        await self._flush_soon()
+
+    async def update_chat_data(self, chat_id: int, data: dict):
+        pass
+
+    async def drop_chat_data(self, chat_id: int):
+        pass
+
+    async def update_bot_data(self, data: dict):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def _flush_soon(self):
+        """Join (or start) the batch write for everything buffered this tick"""
+        if self._flush_task is None or self._flush_taken:
+            # The current batch already took its buffer: start the next one
+            self._flush_taken = False
+            self._flush_task = asyncio.create_task(self._flush_after_tick())
+        await asyncio.shield(self._flush_task)
+
+    async def _flush_after_tick(self):
+        # PTB gathers all update_* calls of a run together; yielding once lets
+        # every one of them add to the buffer before the single write
+        await asyncio.sleep(0)
+        self._flush_taken = True
+        await self.flush()
+
+    async def flush(self):
+        users, self._pending_users = self._pending_users, {}
+        conversations, self._pending_conversations = self._pending_conversations, {}
+        if not users and not conversations:
+            return
+
+        token = f"{self._instance}:{next(self._counter)}"
+        try:
+            await self.db.save_persisted_state(token, users, conversations)
+        except Exception:
+            # PTB has already forgotten these changes: keep them for the next
+            # write, unless a newer change to the same entry came in meanwhile
+            for user_id, data in users.items():
+                self._pending_users.setdefault(user_id, data)
+            for name_key, entry in conversations.items():
+                self._pending_conversations.setdefault(name_key, entry)
+            raise
+        for user_id, data in users.items():
+            if data is None:
+                self._user_tokens.pop(user_id, None)
+            else:
+                self._user_tokens[user_id] = token
+        for name_key, (user_id, state) in conversations.items():
+            self._remember_conversation(name_key, user_id, None if state is None else token)
+        logger.debug(f"Persisted {len(users)} user(s) and {len(conversations)} conversation(s)")
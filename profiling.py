@@ -0,0 +1,230 @@
+"""
+Profiling
+Opt-in slow-update span logs and sampled flame-graph stacks for webhook updates
+"""
+
+import asyncio
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DUMP_INTERVAL = 30.0  # seconds between rewrites of the collapsed-stacks file
+
+_NO_TRACE = nullcontext()
+
+
+class Trace:
+    """Where one update's time went"""
+
+    __slots__ = ('update_id', 'kind', 'received', 'parse', 'started', 'db', 'db_calls', 'outbound',
+                 'outbound_calls')
+
+    def __init__(self, update_id: int, kind: str, received: Optional[float], parse: float):
+        self.update_id = update_id
+        self.kind = kind
+        self.received = received
+        self.parse = parse
+        self.started = time.perf_counter()
+        self.db = 0.0
+        self.db_calls = 0
+        self.outbound = 0.0
+        self.outbound_calls = 0
+
+    def add_db(self, seconds: float):
+        self.db += seconds
+        self.db_calls += 1
+
+    def add_outbound(self, seconds: float):
+        self.outbound += seconds
+        self.outbound_calls += 1
+
+
+# The update being processed by the current task, if it is traced
+current_trace: ContextVar[Optional[Trace]] = ContextVar('current_trace', default=None)
+
+
+def _update_kind(update) -> str:
+    for kind in ('callback_query', 'message', 'edited_message'):
+        if getattr(update, kind, None) is not None:
+            return kind
+    return 'other'
+
+
+def _frame_name(frame) -> str:
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+
+
+class Profiler:
+    """Slow-update span logging and sampling profiler for processed updates
+
+    - slow_ms > 0: every update is traced; one taking longer is logged
+      with its parse / queue / dispatch split, and the DB and Bot API time
+      inside dispatch.
+    - sample_rate > 0: that fraction of updates is sampled every
+      `interval` seconds by a background thread, which records the
+      update's await chain (plus the synchronous frames when it is
+      running). Stacks are written in the collapsed format used by
+      flamegraph.pl and speedscope to `directory`.
+
+    With both off, trace() returns a shared no-op context manager and the
+    DB/outbound hooks see no current trace.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, slow_ms: float = 0.0, directory: str = 'profiles',
+                 interval: float = 0.005):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.directory = directory
+        self.interval = interval
+        self.enabled = sample_rate > 0 or slow_ms > 0
+        self._received = {}  # update_id -> (received, parse seconds), until a worker picks it up
+        self._sampled = set()  # tasks currently being sampled
+        self._stacks = Counter()
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread = None
+        self._last_dump = time.monotonic()
+
+        # Metrics
+        self.traced = 0
+        self.slow = 0
+        self.sampled = 0
+
+    def start(self):
+        """Start the sampler thread (only when sampling is on)"""
+        if self.sample_rate <= 0:
+            return
+        self._loop_thread = threading.get_ident()
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample_loop, name='profiler', daemon=True)
+        self._sampler.start()
+        logger.info(f"Profiling {self.sample_rate:.0%} of updates into {self.directory}")
+
+    def stop(self):
+        """Stop sampling and write the stacks collected so far"""
+        if self._sampler is None:
+            return
+        self._stop.set()
+        self._sampler.join()
+        self._sampler = None
+        self.dump()
+
+    def received(self, update, received: float):
+        """Note when the webhook got an update and how long parsing took"""
+        if self.enabled:
+            self._received[update.update_id] = (received, time.perf_counter() - received)
+
+    def discard(self, update):
+        """Forget an update the webhook did not queue"""
+        if self.enabled:
+            self._received.pop(update.update_id, None)
+
+    def trace(self, update):
+        """Context manager around processing one update"""
+        if not self.enabled:
+            return _NO_TRACE
+        return self._trace(update)
+
+    @contextmanager
+    def _trace(self, update):
+        received, parse = self._received.pop(update.update_id, (None, 0.0))
+        trace = Trace(update.update_id, _update_kind(update), received, parse)
+        token = current_trace.set(trace)
+        task = None
+        if self._sampler is not None and random.random() < self.sample_rate:
+            task = asyncio.current_task()
+            self._sampled.add(task)
+            self.sampled += 1
+        try:
+            yield trace
+        finally:
+            current_trace.reset(token)
+            if task is not None:
+                self._sampled.discard(task)
+                if time.monotonic() - self._last_dump > DUMP_INTERVAL:
+                    self.dump()
+            self.traced += 1
+            self._finish(trace)
+
+    def _finish(self, trace: Trace):
+        dispatch = time.perf_counter() - trace.started
+        queued = trace.started - trace.received - trace.parse if trace.received is not None else 0.0
+        total = trace.parse + queued + dispatch
+        if self.slow_ms <= 0 or total * 1000 < self.slow_ms:
+            return
+        self.slow += 1
+        other = max(dispatch - trace.db - trace.outbound, 0.0)
+        logger.warning(
+            f"Slow update {trace.update_id} ({trace.kind}): {total * 1000:.1f} ms = "
+            f"parse {trace.parse * 1000:.1f} + queue {queued * 1000:.1f} + dispatch {dispatch * 1000:.1f} ms "
+            f"[db {trace.db * 1000:.1f} ms in {trace.db_calls} calls, "
+            f"outbound {trace.outbound * 1000:.1f} ms in {trace.outbound_calls} calls, "
+            f"other {other * 1000:.1f} ms]"
+        )
+
+    # ---------- Sampling ----------
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            for task in list(self._sampled):
+                try:
+                    stack = self._stack(task)
+                except Exception:
+                    continue  # the task moved on while we walked it
+                if stack:
+                    self._stacks[';'.join(stack)] += 1
+
+    def _stack(self, task) -> List[str]:
+        """Outermost-first frames of a task: its await chain, then what is running"""
+        names = ['update']
+        coro = task.get_coro()
+        innermost = None
+        while coro is not None:
+            frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None)
+            if frame is None:
+                break
+            names.append(_frame_name(frame))
+            innermost = coro
+            coro = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None)
+
+        # Running right now: add the synchronous calls below the innermost coroutine
+        if innermost is not None and getattr(innermost, 'cr_running', False):
+            frame = sys._current_frames().get(self._loop_thread)
+            running = []
+            while frame is not None and frame is not innermost.cr_frame:
+                running.append(_frame_name(frame))
+                frame = frame.f_back
+            if frame is not None:
+                names.extend(reversed(running))
+        return names
+
+    def dump(self):
+        """Rewrite the collapsed-stacks file for this process"""
+        self._last_dump = time.monotonic()
+        stacks = dict(self._stacks)
+        if not stacks:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'stacks-{os.getpid()}.collapsed')
+        with open(path, 'w') as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f'{stack} {count}\n')
+        logger.info(f"Wrote {len(stacks)} sampled stacks to {path}")
+
+    def stats(self) -> Dict[str, float]:
+        """Traced, slow and sampled update counters"""
+        return {
+            'traced': self.traced,
+            'slow': self.slow,
+            'sampled': self.sampled,
+            'stacks': len(self._stacks),
+        }
@@ -0,0 +1,233 @@
+"""
+Reminder Scheduler
+Sends each confirmed appointment a reminder a set time before it starts, from inside the bot process
+"""
+
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from telegram.error import BadRequest, Forbidden
+
+from database import AsyncDatabase
+
+logger = logging.getLogger(__name__)
+
+REMIND_BEFORE = 24 * 3600  # seconds before the appointment
+
+
+def starts_at(reminder: dict) -> float:
+    """Start of the appointment as a timestamp (dates and times are local)"""
+    return datetime.strptime(f"{reminder['date']} {reminder['time']}", '%Y-%m-%d %H:%M').timestamp()
+
+
+def _key(moment: float) -> tuple:
+    """(date, time) of a timestamp, comparable with the appointments columns"""
+    local = datetime.fromtimestamp(moment)
+    return local.strftime('%Y-%m-%d'), local.strftime('%H:%M')
+
+
+class ReminderScheduler:
+    """Min-heap of upcoming reminder deadlines, filled from the database a window at a time
+
+    Appointments starting within remind_before + lookahead seconds are read
+    in (date, time, id) order from the partial index of reminders not yet
+    sent and pushed on a heap keyed by deadline (start - remind_before).
+    New bookings are pushed by add(). Due reminders are claimed in the
+    database, passed to `send` concurrently in batches of `batch_size`
+    (the outbound rate limiter paces them), and recorded as sent.
+
+    The claim makes every process skip a reminder another one is sending;
+    a claim older than `claim_timeout` (its process died) is taken over.
+    Every `rescan_interval` the window is read again from the start, which
+    picks up bookings made by other workers and reminders whose claim went
+    stale. Reminders missed while the bot was down are sent on startup,
+    as long as the appointment has not started. A crash between sending
+    and recording a batch sends that batch again.
+    """
+
+    def __init__(self, db: AsyncDatabase, send: Callable[[dict], Awaitable],
+                 remind_before: float = REMIND_BEFORE, lookahead: float = 3600.0,
+                 batch_size: int = 50, rescan_interval: float = 600.0,
+                 claim_timeout: float = 300.0, retry_delay: float = 60.0):
+        self.db = db
+        self._send = send
+        self.remind_before = remind_before
+        self.lookahead = lookahead
+        self.batch_size = batch_size
+        self.rescan_interval = rescan_interval
+        self.claim_timeout = claim_timeout
+        self.retry_delay = retry_delay
+        self._heap = []      # (deadline, appointment id, reminder)
+        self._queued = set()  # appointment ids on the heap
+        self._after: Optional[tuple] = None  # last (date, time, id) read into the heap
+        self._until: Optional[tuple] = None  # (date, time) the heap is filled up to
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        # Metrics
+        self.loaded = 0
+        self.sent = 0
+        self.batches = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def start(self):
+        """Spawn the scheduler task"""
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run(), name="reminder-scheduler")
+
+    async def add(self, reminder: dict):
+        """Schedule a new booking's reminder
+
+        `reminder` has the appointment's id, telegram_id, name, service,
+        date and time. A booking made less than remind_before ahead is
+        recorded as reminded: its confirmation is recent enough.
+        """
+        deadline = starts_at(reminder) - self.remind_before
+        if deadline <= time.time():
+            await self.db.mark_reminders_sent([reminder['id']])
+            self.skipped += 1
+            return
+        # Beyond the loaded window the next load reads it from the database
+        if self._until is not None and (reminder['date'], reminder['time']) <= self._until:
+            self._push(deadline, reminder)
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    def _push(self, deadline: float, reminder: dict):
+        if reminder['id'] not in self._queued:
+            self._queued.add(reminder['id'])
+            heapq.heappush(self._heap, (deadline, reminder['id'], reminder))
+
+    async def _run(self):
+        next_rescan = 0.0
+        next_load = 0.0
+        while not self._stopping:
+            try:
+                now = time.time()
+                if now >= next_rescan:
+                    self._after = None
+                    next_rescan = now + self.rescan_interval
+                    next_load = now
+                if now >= next_load:
+                    await self._load(now)
+                    next_load = now + self.lookahead / 2
+
+                due = []
+                while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+                    _, appointment_id, reminder = heapq.heappop(self._heap)
+                    self._queued.discard(appointment_id)
+                    due.append(reminder)
+                if due:
+                    await self._send_batch(due)
+                    continue
+
+                wake_at = min(next_load, next_rescan)
+                if self._heap:
+                    wake_at = min(wake_at, self._heap[0][0])
+                await self._wait(wake_at - time.time())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Reminder scheduler failed: {e}")
+                await asyncio.sleep(self.retry_delay)
+
+    async def _wait(self, timeout: float):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), max(timeout, 0))
+        except asyncio.TimeoutError:
+            pass
+
+    async def _load(self, now: float):
+        """Read reminders not yet sent up to the end of the window onto the heap"""
+        self._until = _key(now + self.remind_before + self.lookahead)
+        if self._after is None:
+            self._after = (*_key(now), 0)  # appointments already started get no reminder
+        while True:
+            rows = await self.db.get_pending_reminders(self._after, self._until, self.batch_size)
+            for reminder in rows:
+                self._push(starts_at(reminder) - self.remind_before, reminder)
+            self.loaded += len(rows)
+            if rows:
+                last = rows[-1]
+                self._after = (last['date'], last['time'], last['id'])
+            if len(rows) < self.batch_size:
+                return
+
+    async def _send_batch(self, due: List[dict]):
+        """Claim, send and record one batch of due reminders"""
+        now = time.time()
+        claimed = set(await self.db.claim_reminders(
+            [reminder['id'] for reminder in due], int(now - self.claim_timeout)
+        ))
+        # Unclaimed: cancelled, already reminded, or another process is sending it
+        batch = [reminder for reminder in due if reminder['id'] in claimed]
+        if not batch:
+            return
+
+        results = await asyncio.gather(*(self._send_one(reminder, now) for reminder in batch))
+        done = [reminder['id'] for reminder, ok in zip(batch, results) if ok]
+        retry = [reminder for reminder, ok in zip(batch, results) if not ok]
+        if done:
+            await self.db.mark_reminders_sent(done)
+        if retry:
+            await self.db.release_reminders([reminder['id'] for reminder in retry])
+            for reminder in retry:
+                self._push(time.time() + self.retry_delay, reminder)
+        self.batches += 1
+
+    async def _send_one(self, reminder: dict, now: float) -> bool:
+        """Send one reminder; False if it should be retried"""
+        if starts_at(reminder) <= now:
+            self.skipped += 1  # too late to be useful
+            return True
+        try:
+            await self._send(reminder)
+        except (Forbidden, BadRequest) as e:
+            # The customer blocked the bot or the chat is gone: retrying will not help
+            logger.warning(f"Dropped reminder for appointment #{reminder['id']}: {e}")
+            self.failed += 1
+            return True
+        except Exception as e:
+            logger.error(f"Failed to send reminder for appointment #{reminder['id']}: {e}")
+            self.failed += 1
+            return False
+        self.sent += 1
+        return True
+
+    async def stop(self, timeout: float = 10.0):
+        """Let the batch being sent finish, then stop the scheduler task
+        
+        A batch still unfinished after `timeout` is cancelled; its reminders
+        stay claimed and are retried after claim_timeout.
+        """
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        except Exception as e:
+            logger.error(f"Reminder scheduler stopped with an error: {e}")
+        self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        """Heap size and reminder counters"""
+        return {
+            'queued': len(self._heap),
+            'loaded': self.loaded,
+            'sent': self.sent,
+            'batches': self.batches,
+            'skipped': self.skipped,
+            'failed': self.failed,
+        }
@@ -0,0 +1,27 @@
+"""Every Database read is answered through an index, never a full scan of appointments"""
+
+from datetime import datetime
+
+import pytest
+
+from benchmark import database_reads, query_plans, seed_appointments, uses_index
+from database import Database
+
+READS = database_reads(datetime.now().strftime('%Y-%m-%d'))
+
+
+@pytest.fixture(scope='module')
+def db(tmp_path_factory):
+    database = Database(str(tmp_path_factory.mktemp('plans') / 'plans.db'))
+    seed_appointments(database, 2000)
+    database.get_connection().execute('ANALYZE')
+    yield database
+    database.close()
+
+
+@pytest.mark.parametrize('name', list(READS))
+def test_read_uses_an_index(db, name):
+    plans = query_plans(db, READS[name])
+    assert plans, f"{name} ran no SELECT"
+    for plan in plans:
+        assert uses_index(plan), f"{name}: {' | '.join(plan)}"
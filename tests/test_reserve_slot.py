@@ -0,0 +1,48 @@
+"""Database.reserve_slot books a slot at most once per staff member, even when raced"""
+
+import pytest
+
+from benchmark import reserve_concurrently
+from database import Database
+
+DATE = '2099-01-01'
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / 'reserve.db'))
+    yield database
+    database.close()
+
+
+def test_one_chair_one_winner(db):
+    results = reserve_concurrently(db, attempts=200, threads=32)
+
+    assert sum(result.ok for result in results) == 1
+    assert len(db.get_appointments_by_date(DATE)) == 1
+    assert all(result.conflict is not None for result in results if not result.ok)
+
+
+@pytest.mark.parametrize('staff', [2, 5])
+def test_one_winner_per_staff_member(db, staff):
+    staff_ids = [f"s{i}" for i in range(staff)]
+    results = reserve_concurrently(db, attempts=200, threads=32, staff_ids=staff_ids)
+
+    winners = [result for result in results if result.ok]
+    stored = db.get_appointments_by_date(DATE)
+    assert len(winners) == len(stored) == staff
+    assert sorted(result.staff_id for result in winners) == sorted(row['staff_id'] for row in stored) == staff_ids
+
+
+def test_booking_without_staff_blocks_everyone(db):
+    assert db.reserve_slot(1, 'haircut', DATE, '10:00', "Chair", "+1", 30).ok
+
+    result = db.reserve_slot(2, 'haircut', DATE, '10:15', "Staff", "+1", 30, ['s0', 's1'])
+    assert not result.ok
+    assert result.conflict['time'] == '10:00'
+
+
+def test_adjacent_slots_do_not_overlap(db):
+    assert db.reserve_slot(1, 'haircut', DATE, '10:00', "First", "+1", 30).ok
+    assert db.reserve_slot(2, 'haircut', DATE, '10:30', "Second", "+1", 30).ok
+    assert not db.reserve_slot(3, 'haircut', DATE, '10:29', "Third", "+1", 30).ok
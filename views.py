@@ -0,0 +1,194 @@
+"""
+Views
+Keyboards and message templates, built once instead of on every update
+"""
+
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from catalog import Service
+
+CUSTOMER = 'customer'
+ADMIN = 'admin'
+
+# ===== Static messages =====
+
+WELCOME_TEXT = (
+    "💈 *Welcome to Anthony Studio!*\n\n"
+    "Book your appointment in 3 easy steps:\n"
+    "1️⃣ Enter your details\n"
+    "2️⃣ Choose service & time\n"
+    "3️⃣ Confirm booking\n\n"
+    "👇 What would you like to do?"
+)
+
+WELCOME_BACK_TEXT = "💈 *Welcome Back!*\n\nWhat would you like to do?"
+
+ADMIN_PANEL_TEXT = "⚙️ *Admin Panel*\n\nChoose an option:"
+
+CHOOSE_SERVICE_TEXT = (
+    "Perfect! 📞\n\n"
+    "Step 3 of 3\n\n"
+    "💇 *Choose Your Service:*"
+)
+
+# ===== Static keyboards (Telegram objects are immutable, so sharing is safe) =====
+
+BACK_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data='back')]])
+
+BACK_TO_ADMIN_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back to Admin", callback_data='admin')]])
+
+CANCEL_TO_ADMIN_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data='admin')]])
+
+ADMIN_PANEL_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📊 Today's Bookings", callback_data='admin_today')],
+    [InlineKeyboardButton("📅 Tomorrow's Bookings", callback_data='admin_tomorrow')],
+    [InlineKeyboardButton("📤 Forward All Bookings", callback_data='admin_forward')],
+    [InlineKeyboardButton("⬅️ Back", callback_data='back')]
+])
+
+
+def pager_keyboard(back: InlineKeyboardMarkup, prev_data: Optional[str] = None,
+                   next_data: Optional[str] = None) -> InlineKeyboardMarkup:
+    """A back keyboard with Prev/Next buttons above it when there are more pages"""
+    row = []
+    if prev_data:
+        row.append(InlineKeyboardButton("◀️ Prev", callback_data=prev_data))
+    if next_data:
+        row.append(InlineKeyboardButton("Next ▶️", callback_data=next_data))
+    if not row:
+        return back
+    return InlineKeyboardMarkup([row, *back.inline_keyboard])
+
+
+class Views:
+    """Catalog-dependent keyboards and templates, built once at startup (the catalog is read-only)"""
+
+    DATE_PICKER_DAYS = 7
+    DATE_PICKER_CACHE_SIZE = 64  # distinct (day, free counts) pickers kept
+
+    def __init__(self, services: Mapping[str, Service], closed_days: Iterable[int]):
+        self.services = services
+        self.closed_days = closed_days
+        self._week = (None, [])  # (today, its date picker days)
+        self._date_pickers = OrderedDict()  # (today, free counts) -> keyboard
+
+        self._main_menus = {role: self._build_main_menu(role) for role in (CUSTOMER, ADMIN)}
+
+        self.service_keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton(
+                f"{service.name} - ${service.price} ({service.duration}min)",
+                callback_data=f'service_{key}'
+            )]
+            for key, service in services.items()
+        ])
+
+        self.service_texts = {
+            key: (
+                f"Great choice! ✨\n\n"
+                f"Service: *{service.name}*\n"
+                f"Duration: {service.duration} minutes\n"
+                f"Price: ${service.price}\n\n"
+                f"📅 *Select a Date:*"
+            )
+            for key, service in services.items()
+        }
+
+    @staticmethod
+    def _build_main_menu(role: str) -> InlineKeyboardMarkup:
+        keyboard = [
+            [InlineKeyboardButton("📅 Book Appointment", callback_data='book')],
+            [InlineKeyboardButton("📋 My Bookings", callback_data='mybookings')],
+        ]
+        if role == ADMIN:
+            keyboard.append([InlineKeyboardButton("⚙️ Admin", callback_data='admin')])
+        return InlineKeyboardMarkup(keyboard)
+
+    def main_menu(self, is_admin: bool) -> InlineKeyboardMarkup:
+        """Main menu for a customer or the admin"""
+        return self._main_menus[ADMIN if is_admin else CUSTOMER]
+
+    def open_days(self, today: date) -> List[date]:
+        """Days the date picker offers: the open days of the next week"""
+        return [today + timedelta(days=i) for i in range(self.DATE_PICKER_DAYS)
+                if (today + timedelta(days=i)).weekday() not in self.closed_days]
+
+    def week(self, today: date) -> List[Tuple[str, str]]:
+        """('YYYY-MM-DD', button label) of each open day of the next week, rebuilt when the day changes"""
+        if self._week[0] != today:
+            self._week = (today, [(day.strftime('%Y-%m-%d'), day.strftime('%a, %b %d'))
+                                  for day in self.open_days(today)])
+        return self._week[1]
+
+    def date_picker(self, today: date, free: Optional[Dict[str, Optional[int]]] = None) -> InlineKeyboardMarkup:
+        """Open days of the next week, memoized per day and free counts
+
+        With `free` (free start times per 'YYYY-MM-DD', None where not yet
+        known) full days are left out and the others show how many times
+        are free.
+        """
+        week = self.week(today)
+        counts = tuple(None if free is None else free.get(key) for key, _ in week)
+        picker = self._date_pickers.get((today, counts))
+        if picker is not None:
+            self._date_pickers.move_to_end((today, counts))
+            return picker
+
+        keyboard = []
+        for (key, label), count in zip(week, counts):
+            if count is None:
+                keyboard.append([InlineKeyboardButton(label, callback_data=f"date_{key}")])
+            elif count:
+                keyboard.append([InlineKeyboardButton(f"{label} ({count} free)", callback_data=f"date_{key}")])
+        picker = InlineKeyboardMarkup(keyboard)
+
+        self._date_pickers[(today, counts)] = picker
+        while len(self._date_pickers) > self.DATE_PICKER_CACHE_SIZE:
+            self._date_pickers.popitem(last=False)
+        return picker
+
+
+# ===== Long messages =====
+
+MESSAGE_LIMIT = 4096  # Telegram's maximum message length
+
+
+def message_length(text: str) -> int:
+    """Length as Telegram counts it (UTF-16 code units, so emoji count double)"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+class MessagePacker:
+    """Packs text blocks into as few messages as fit under MESSAGE_LIMIT
+
+    The header goes on the first message only. Blocks are never split, so
+    Markdown inside a block stays balanced.
+    """
+
+    def __init__(self, header: str = '', limit: int = MESSAGE_LIMIT):
+        self.limit = limit
+        self._parts = [header] if header else []
+        self._length = message_length(header)
+        self._count = 0
+
+    def add(self, block: str) -> List[tuple]:
+        """Add a block; returns the (text, block_count) messages it completed"""
+        completed = []
+        size = message_length(block)
+        if self._count and self._length + size > self.limit:
+            completed = self.flush()
+        self._parts.append(block)
+        self._length += size
+        self._count += 1
+        return completed
+
+    def flush(self) -> List[tuple]:
+        """Return whatever is buffered as a final (text, block_count) message"""
+        if not self._count:
+            return []
+        message = (''.join(self._parts), self._count)
+        self._parts, self._length, self._count = [], 0, 0
+        return [message]
@@ -0,0 +1,198 @@
+"""
+Webhook Update Queue
+Lets the webhook acknowledge Telegram immediately while workers process updates
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+def update_key(update) -> Hashable:
+    """Ordering key of an update: its chat, else its user, else nothing shared"""
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return ('update', update.update_id)
+
+
+class UpdateQueue:
+    """Bounded update queue drained by a pool of worker tasks
+
+    Different chats are processed in parallel, but updates that share a key
+    (see update_key) run strictly one after another in arrival order, so a
+    ConversationHandler never sees a user's steps out of order. Each key
+    has its own FIFO; a key sits in the ready queue only while it has
+    pending updates and no worker is on it.
+    """
+
+    def __init__(self, process: Callable[[object], Awaitable], maxsize: int = 1000, workers: int = 4,
+                 key: Callable[[object], Hashable] = update_key):
+        self._process = process
+        self._key = key
+        self.maxsize = maxsize
+        self._pending = {}              # key -> deque of (enqueued_at, update)
+        self._ready = asyncio.Queue()   # keys with pending updates and no active worker
+        self._size = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._worker_count = workers
+        self._workers = []
+        self._accepting = False
+
+        # Metrics
+        self.enqueued = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def start(self):
+        """Spawn the worker tasks"""
+        self._accepting = True
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"update-worker-{i}")
+            for i in range(self._worker_count)
+        ]
+        logger.info(f"Update queue started with {self._worker_count} workers")
+
+    def submit(self, update) -> bool:
+        """Enqueue an update; False means the queue is full (or stopping)"""
+        if not self._accepting or self._size >= self.maxsize:
+            self.rejected += 1
+            return False
+
+        key = self._key(update)
+        item = (time.monotonic(), update)
+        pending = self._pending.get(key)
+        if pending is None:
+            self._pending[key] = deque([item])
+            self._ready.put_nowait(key)
+        else:
+            pending.append(item)  # a worker already owns or awaits this key
+
+        self._size += 1
+        self._idle.clear()
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self._size)
+        return True
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            pending = self._pending[key]
+            enqueued_at, update = pending.popleft()
+            wait = time.monotonic() - enqueued_at
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            try:
+                await self._process(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Update processing failed: {e}")
+            finally:
+                # Hand the key back (to the end of the line) or retire it
+                if pending:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._pending[key]
+                self._size -= 1
+                if self._size == 0:
+                    self._idle.set()
+
+    async def stop(self, timeout: float = 10.0):
+        """Stop accepting, finish queued updates (up to timeout), stop workers"""
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Shutdown drain timed out, dropping {self._size} queued updates")
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Update queue stopped")
+
+    def stats(self) -> Dict[str, float]:
+        """Queue depth, throughput and wait-time counters"""
+        dequeued = self.processed + self.failed
+        return {
+            'depth': self._size,
+            'active_chats': len(self._pending),
+            'max_depth': self.max_depth,
+            'enqueued': self.enqueued,
+            'rejected': self.rejected,
+            'processed': self.processed,
+            'failed': self.failed,
+            'wait_avg_ms': round(self.wait_total / dequeued * 1000, 2) if dequeued else 0.0,
+            'wait_max_ms': round(self.wait_max * 1000, 2),
+        }
+
+
+class UpdateDeduplicator:
+    """Drops redelivered updates by remembering recent update_ids
+
+    The in-memory LRU catches redeliveries to this process. Pass `shared`
+    (an async callable returning True the first time an id is seen, such as
+    AsyncDatabase.mark_update_seen) to also catch them across workers.
+    """
+
+    def __init__(self, capacity: int = 10000, shared: Callable[[int], Awaitable[bool]] = None,
+                 forget_shared: Callable[[int], Awaitable] = None):
+        self.capacity = capacity
+        self._seen = OrderedDict()
+        self._shared = shared
+        self._forget_shared = forget_shared
+
+        # Metrics
+        self.checked = 0
+        self.duplicates = 0
+
+    async def is_duplicate(self, update_id: int) -> bool:
+        """Record update_id; True if it was already seen"""
+        self.checked += 1
+        if update_id in self._seen:
+            self._seen.move_to_end(update_id)
+            self.duplicates += 1
+            return True
+
+        # Marked before any await, so concurrent redeliveries see it too
+        self._seen[update_id] = None
+        if len(self._seen) > self.capacity:
+            self._seen.popitem(last=False)
+
+        if self._shared is not None:
+            try:
+                first = await self._shared(update_id)
+            except Exception:
+                # Not recorded anywhere: the redelivery must get through
+                self._seen.pop(update_id, None)
+                raise
+            if not first:
+                self.duplicates += 1
+                return True
+        return False
+
+    async def forget(self, update_id: int):
+        """Un-see an update that was not processed, so a redelivery gets through"""
+        self._seen.pop(update_id, None)
+        if self._forget_shared is not None:
+            await self._forget_shared(update_id)
+
+    def stats(self) -> Dict[str, float]:
+        """Checked/duplicate counters and hit rate"""
+        return {
+            'checked': self.checked,
+            'duplicates': self.duplicates,
+            'hit_rate': round(self.duplicates / self.checked, 4) if self.checked else 0.0,
+            'size': len(self._seen),
+        }